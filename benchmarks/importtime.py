@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Import-time budget check for the headless code paths.
+#
+# Runs 'python -X importtime' in a fresh interpreter for every module below,
+# fails if a module pulls in one of the heavy GUI/export packages, or if its
+# cumulative import time (best of several runs) exceeds the budget.
+#
+#   python3 benchmarks/importtime.py [--budget-ms 400] [--runs 5]
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must stay cheap to import
+HEADLESS_MODULES = [
+    "tapesprocketdesigner.geometry",
+    "tapesprocketdesigner.exporters",
+    "tapesprocketdesigner.batch",
+    "tapesprocketdesigner.server",
+    "tapesprocketdesigner.cli",
+]
+
+HEAVY_PACKAGES = ("PySide6", "shiboken6", "ezdxf", "svgwrite")
+
+def measureImport(module : str):
+    # returns (cumulative import time in microseconds, set of top-level packages imported)
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+        env=env, capture_output=True, text=True, check=True)
+
+    total = 0
+    packages = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        packages.add(name.split(".")[0])
+        if name == module:
+            total = int(cumulative)
+
+    return total, packages
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import-time budget of the headless modules.")
+    parser.add_argument("--budget-ms", type=float, default=400.0,
+        help="maximum cumulative import time per module (default: %(default)s ms)")
+    parser.add_argument("--runs", type=int, default=5, help="runs per module, best is kept (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in HEADLESS_MODULES:
+        best = None
+        for _ in range(args.runs):
+            total, packages = measureImport(module)
+            best = total if best is None else min(best, total)
+
+        heavy = sorted(p for p in packages if p in HEAVY_PACKAGES)
+        ok = (not heavy) and (best / 1000.0 <= args.budget_ms)
+        failed = failed or not ok
+        print("{:s} {:40s} {:8.1f} ms {:s}".format("ok  " if ok else "FAIL", module, best / 1000.0,
+            ("imports " + ", ".join(heavy)) if heavy else ""))
+
+    return 1 if failed else 0
+
+if (__name__ == "__main__"):
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Benchmark suite for the hot paths: geometry, DXF/SVG export (single files
+# and batches, including the ezdxf writer) and canvas rendering.
+#
+# Every case is called once to warm up, then timed in several rounds of
+# enough calls to last --min-time; the best and the median time per call are
+# kept. A separate call under tracemalloc records the peak of the Python (and
+# NumPy) allocations. The canvas is rendered with Qt's offscreen platform, so
+# no display is needed; without PySide6 those cases are skipped.
+#
+#   python3 benchmarks/suite.py -o results.json
+#   python3 benchmarks/suite.py --baseline results.json [--threshold 0.25]
+#
+# With --baseline, every case is compared with the same case in an earlier
+# results file, and the exit status is 1 when one got slower than the threshold.
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# must be set before Qt is loaded
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+from tapesprocketdesigner.geometry import SprocketParameters, computeSprocket, computeSprockets
+from tapesprocketdesigner.engagement import checkEngagement
+from tapesprocketdesigner.exporters import writeDXF, writeDXFEzdxf, writeSVG
+from tapesprocketdesigner.batch import BatchOptions, runBatch
+
+# tooth counts from a typical feeder sprocket up to a stress test
+TOOTH_COUNTS = (14, 100, 1000, 10000)
+
+# arc tolerance of the on-screen outline, as in the GUI
+CANVAS_TOLERANCE = 0.001
+
+CANVAS_SIZE = (800, 800)
+
+# the QApplication has to outlive all canvases
+application = None
+
+def designs(count : int, seed : int = 1) -> list:
+    # 'count' varied, valid designs for the batch cases
+    rng = np.random.default_rng(seed)
+    return [SprocketParameters(int(rng.integers(10, 120)), 1.0, 4.0, float(rng.uniform(0.5, 1.5)),
+        float(rng.uniform(20, 90))) for _ in range(count)]
+
+def geometryCases(workDir : str) -> dict:
+    # computeGear equivalent: sprocket, on-screen outline and tape clearance
+    cases = {}
+    for n in TOOTH_COUNTS:
+        params = SprocketParameters(n_teeth=n)
+        sprocket = computeSprocket(params)
+        cases["geometry.sprocket.{:d}".format(n)] = lambda params=params: computeSprocket(params)
+        cases["geometry.tessellate.{:d}".format(n)] = lambda s=sprocket: s.outline.tessellate(CANVAS_TOLERANCE)
+        cases["geometry.engagement.{:d}".format(n)] = lambda s=sprocket: checkEngagement(s)
+
+    rows = designs(1000)
+    cases["geometry.batch.1000"] = lambda: computeSprockets(rows)
+    return cases
+
+def exportCases(workDir : str) -> dict:
+    cases = {}
+    for n in TOOTH_COUNTS[:3]:
+        sprocket = computeSprocket(SprocketParameters(n_teeth=n))
+        outline = sprocket.outline
+        base = os.path.join(workDir, "single_{:d}".format(n))
+        cases["export.dxf.{:d}".format(n)] = lambda o=outline, f=base + ".dxf": writeDXF(f, o)
+        cases["export.dxf_polyline.{:d}".format(n)] = lambda o=outline, f=base + ".dxf": writeDXF(f, o, polyline=True)
+        cases["export.dxf_ezdxf.{:d}".format(n)] = lambda o=outline, f=base + ".dxf": writeDXFEzdxf(f, o)
+        cases["export.svg.{:d}".format(n)] = lambda o=outline, r=sprocket.max_outer_radius, f=base + ".svg": writeSVG(f, o, r)
+
+    # whole batch runs in this process, so that the times do not depend on the number of cores
+    rows = [("design_{:04d}".format(i), params) for i, params in enumerate(designs(200))]
+    batchDir = os.path.join(workDir, "batch")
+    cases["batch.dxf_svg.200"] = lambda: runBatch(rows, batchDir, BatchOptions(("dxf", "svg")), jobs=1)
+    cases["batch.dxf_ezdxf.50"] = lambda: runBatch(rows[:50], batchDir, BatchOptions(("dxf",), "ezdxf"), jobs=1)
+    return cases
+
+def paintCases(workDir : str) -> dict:
+    # SprocketCanvas.paintEvent on the offscreen platform: a full repaint after
+    # setOutline/resize, and a repaint from the cached pixmap. The canvas has to
+    # be shown, a hidden widget gets a pending resize event on every paint.
+    try:
+        from PySide6.QtWidgets import QApplication
+    except ImportError:
+        return {}
+    from tapesprocketdesigner.sprocketcanvas import SprocketCanvas
+
+    global application
+    application = QApplication.instance() or QApplication([])
+    cases = {}
+    for n in TOOTH_COUNTS[:3]:
+        sprocket = computeSprocket(SprocketParameters(n_teeth=n))
+        canvas = SprocketCanvas()
+        canvas.resize(*CANVAS_SIZE)
+        canvas.show()
+        application.processEvents()
+        canvas.setOutline(sprocket.outline.tessellate(CANVAS_TOLERANCE), sprocket.outer_radius)
+        canvas.setCircle(sprocket.design_radius)
+
+        def full(canvas=canvas):
+            canvas.updateScale()
+            canvas.repaint()
+        cases["paint.full.{:d}".format(n)] = full
+        cases["paint.cached.{:d}".format(n)] = canvas.repaint
+    return cases
+
+def timeCase(function, minTime : float, repeat : int) -> dict:
+    # one untimed call first, so that imports, caches and lazy setup do not
+    # end up in the calibration
+    function()
+
+    # calibrate the number of calls per round so that a round lasts at least minTime;
+    # the calibration rounds are not part of the statistics
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= minTime:
+            break
+        loops *= max(2, min(10, int(minTime / max(elapsed, 1e-9))))
+
+    rounds = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            function()
+        rounds.append((time.perf_counter() - t0) / loops)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "best_s" : min(rounds),
+        "median_s" : statistics.median(rounds),
+        "loops" : loops,
+        "rounds" : len(rounds),
+        "peak_kib" : peak / 1024.0,
+    }
+
+def metadata() -> dict:
+    versions = { "python" : platform.python_version(), "numpy" : np.__version__ }
+    for package in ("PySide6", "ezdxf"):
+        try:
+            versions[package] = __import__(package).__version__
+        except ImportError:
+            versions[package] = None
+    return {
+        "time" : time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform" : platform.platform(),
+        "machine" : platform.machine(),
+        "cpu_count" : os.cpu_count(),
+        "versions" : versions,
+    }
+
+def compare(results : dict, baseline : dict, threshold : float) -> list:
+    # returns the names of the cases that got slower than the threshold
+    slower = []
+    print("\n{:32s} {:>12s} {:>12s} {:>8s}".format("case", "baseline", "now", "ratio"))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median_s"] / baseline[name]["median_s"]
+        regressed = ratio > 1.0 + threshold
+        if regressed:
+            slower.append(name)
+        print("{:32s} {:10.3f}ms {:10.3f}ms {:7.2f}x {:s}".format(name, 1000*baseline[name]["median_s"],
+            1000*result["median_s"], ratio, "SLOWER" if regressed else ""))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time geometry, export and rendering of the sprocket designer.")
+    parser.add_argument("-o", "--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="JSON results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25,
+        help="allowed slowdown against the baseline, as a fraction (default: %(default)s)")
+    parser.add_argument("--min-time", type=float, default=0.1,
+        help="minimum duration of a timing round in seconds (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per case (default: %(default)s)")
+    parser.add_argument("-k", "--filter", default=None, help="only run cases whose name contains this text")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+
+    workDir = tempfile.mkdtemp(prefix="tsd_bench_")
+    results = {}
+    try:
+        for group in (geometryCases, exportCases, paintCases):
+            cases = group(workDir)
+            for name, function in cases.items():
+                if args.filter and args.filter not in name:
+                    continue
+                result = timeCase(function, args.min_time, args.repeat)
+                results[name] = result
+                print("{:32s} {:10.3f} ms  (best {:.3f} ms, {:d} loops, peak {:.0f} KiB)".format(name,
+                    1000*result["median_s"], 1000*result["best_s"], result["loops"], result["peak_kib"]), flush=True)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    document = dict(metadata(), max_rss_kib=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, results=results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    if baseline is not None:
+        slower = compare(results, baseline, args.threshold)
+        if slower:
+            print("\n{:d} case(s) slower than the baseline: {:s}".format(len(slower), ", ".join(slower)))
+            return 1
+    return 0
+
+if (__name__ == "__main__"):
+    sys.exit(main())
@@ -0,0 +1,6 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+from .cli import main
+
+main()
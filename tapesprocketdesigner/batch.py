@@ -0,0 +1,348 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Headless batch generator: reads parameter rows from a CSV or JSONL file
+# and writes DXF/SVG/G-code/STL/3MF files plus a manifest into an output directory.
+#
+# CSV files need a header row, JSONL files one object per line. The column
+# names are the SprocketParameters fields:
+#   n_teeth, tooth_dia, tooth_pitch, flank_height, tooth_length_pct
+# and an optional 'name' that is used as the output file name.
+
+import argparse
+import csv
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from .geometry import SprocketParameters, computeSprockets
+from .exporters import writeDXF, writeDXFEzdxf, writeSVG, writeGCode, writeSTL, write3MF
+from .toolpath import MillingOptions, computeToolpath, shoulderDrills
+from .outline import Outline
+from .engagement import checkEngagement
+from .cache import GeometryCache, cacheKey
+from .profiling import span
+
+FORMATS = ("dxf", "svg", "gcode", "stl", "3mf")
+
+# arc tolerance of STL/3MF models when --tessellate is not given
+MESH_TOLERANCE = 0.01
+DXF_ENGINES = ("stream", "polyline", "ezdxf")
+
+def parseInteger(record : dict, field : str) -> int:
+    # int() would truncate 3.7 to 3, a fractional number is malformed instead
+    value = record[field]
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError("{:s} must be an integer, not {!r}".format(field, value))
+    return int(value)
+
+def parseParameters(record : dict) -> SprocketParameters:
+    # raises KeyError for a missing and ValueError for a malformed field
+    return SprocketParameters(
+        n_teeth = parseInteger(record, "n_teeth"),
+        tooth_dia = float(record["tooth_dia"]),
+        tooth_pitch = float(record["tooth_pitch"]),
+        flank_height = float(record["flank_height"]),
+        tooth_length_pct = float(record["tooth_length_pct"]))
+
+def readRows(fileName : str) -> list:
+    # returns a list of (name, SprocketParameters)
+    with open(fileName, "r", newline="") as f:
+        if fileName.lower().endswith((".jsonl", ".json")):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+
+    rows = []
+    names = set()
+    for index, record in enumerate(records):
+        try:
+            params = parseParameters(record)
+        except (KeyError, ValueError) as e:
+            raise ValueError("{:s}: row {:d}: {:s}".format(fileName, index+1, str(e)))
+
+        # rows with the same name would overwrite each other's files: later ones get a _2, _3, ... suffix
+        name = base = str(record.get("name") or "sprocket_{:05d}".format(index))
+        count = 1
+        while name in names:
+            count += 1
+            name = "{:s}_{:d}".format(base, count)
+        names.add(name)
+        rows.append((name, params))
+
+    return rows
+
+class BatchOptions(NamedTuple):
+    formats : tuple = ("dxf", "svg")
+    dxf_engine : str = "stream"         # one of DXF_ENGINES
+    svg_precision : int = 3
+    tolerance : float = None            # tessellate arcs into chords instead of writing true arcs
+    milling : MillingOptions = None     # cutter for G-code, and for the drill hits in DXF files
+    thickness : float = 3.0             # extrusion height of STL/3MF models
+    bore_dia : float = 0.0              # center hole of STL/3MF models, 0 for none
+
+def finiteOrNone(value : float):
+    # NaN and infinity are not valid JSON, the manifest has null instead
+    return value if math.isfinite(value) else None
+
+def outlineFor(sprocket, options : BatchOptions):
+    outline = sprocket.outline
+    if options.milling is not None and options.milling.drills:
+        outline = Outline(outline.vertices, outline.bulges, shoulderDrills(sprocket, options.milling.tool_dia))
+    if options.tolerance:
+        return outline.tessellate(options.tolerance)
+    return outline
+
+def generateChunk(rows, outputDir : str, options : BatchOptions) -> list:
+    # worker entry point: computes the geometry for all rows in one go,
+    # then writes the requested files. Returns the manifest entries.
+    t0 = time.perf_counter()
+    with span("geometry"):
+        sprockets = computeSprockets([params for _, params in rows])
+    geometry_s = (time.perf_counter() - t0) / max(len(rows), 1)
+
+    manifest = []
+    for (name, params), sprocket in zip(rows, sprockets):
+        outputs = {}
+        errors = {}
+        timing = { "geometry_s" : geometry_s }
+        valid = sprocket.isValid()
+        if not valid:
+            # nothing is written for impossible parameters
+            errors["geometry"] = "the parameters do not describe a valid sprocket"
+        t0 = time.perf_counter()
+        outline = None
+        if valid:
+            try:
+                outline = outlineFor(sprocket, options)
+            except ValueError as e:
+                # a --tessellate tolerance too small for this design
+                errors["tessellate"] = str(e)
+        timing["outline_s"] = time.perf_counter() - t0
+        for fmt in (options.formats if outline is not None else ()):
+            fileName = os.path.join(outputDir, "{:s}.{:s}".format(name, fmt))
+            t0 = time.perf_counter()
+            if fmt == "dxf" and options.dxf_engine == "ezdxf":
+                writeDXFEzdxf(fileName, outline)
+            elif fmt == "dxf":
+                writeDXF(fileName, outline, polyline=(options.dxf_engine == "polyline"))
+            elif fmt == "gcode":
+                try:
+                    toolpath = computeToolpath(sprocket, options.milling)
+                except ValueError as e:
+                    # e.g. the cutter does not fit between the teeth
+                    errors[fmt] = str(e)
+                    continue
+                writeGCode(fileName, toolpath, options.milling)
+            elif fmt in ("stl", "3mf"):
+                writer = writeSTL if fmt == "stl" else write3MF
+                try:
+                    writer(fileName, sprocket.outline, options.thickness, options.bore_dia,
+                        options.tolerance or MESH_TOLERANCE)
+                except ValueError as e:
+                    # e.g. a bore larger than the inner diameter
+                    errors[fmt] = str(e)
+                    continue
+            else:
+                writeSVG(fileName, outline, sprocket.max_outer_radius, options.svg_precision)
+            timing[fmt + "_s"] = time.perf_counter() - t0
+            outputs[fmt] = fileName
+
+        t0 = time.perf_counter()
+        with span("geometry.engagement"):
+            clearance = checkEngagement(sprocket).min_clearance if valid else None
+        timing["engagement_s"] = time.perf_counter() - t0
+
+        manifest.append({
+            "name" : name,
+            "parameters" : params._asdict(),
+            "inner_diameter" : finiteOrNone(sprocket.inner_radius * 2),
+            "design_diameter" : finiteOrNone(sprocket.design_radius * 2),
+            "outer_diameter" : finiteOrNone(sprocket.outer_radius * 2),
+            "max_outer_diameter" : finiteOrNone(sprocket.max_outer_radius * 2),
+            "tape_clearance" : None if clearance is None else finiteOrNone(clearance),
+            "outputs" : outputs,
+            "errors" : errors,
+            "timing" : timing
+        })
+
+    return manifest
+
+def rowKey(params : SprocketParameters, options : BatchOptions) -> tuple:
+    # everything the output files of one row depend on, apart from the format
+    return cacheKey(params, options.dxf_engine, options.svg_precision, options.tolerance, options.milling,
+        options.thickness, options.bore_dia)
+
+def runBatch(rows, outputDir : str, options : BatchOptions = BatchOptions(), jobs : int = None,
+    chunkSize : int = None, cache : GeometryCache = None) -> list:
+    # Rows with identical (normalized) parameters are only generated once and
+    # their files copied for the duplicates. With a cache, rows whose output
+    # is already cached are written straight from it.
+    os.makedirs(outputDir, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+
+    manifest = [None] * len(rows)
+    first = {}          # row key -> index of the first row with that key
+    duplicates = []
+    todo = []
+    for index, (name, params) in enumerate(rows):
+        key = rowKey(params, options)
+        if key in first:
+            duplicates.append((index, first[key]))
+            continue
+        first[key] = index
+
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None and all(fmt in cached["outputs"] for fmt in options.formats):
+            manifest[index] = writeCached(name, params, cached, outputDir, options)
+        else:
+            todo.append(index)
+
+    if not chunkSize:
+        # a few chunks per worker keeps the pool busy, bigger chunks keep the geometry vectorized
+        chunkSize = max(1, min(64, -(-len(todo) // (jobs*4))))
+    chunks = [[rows[i] for i in todo[k:k+chunkSize]] for k in range(0, len(todo), chunkSize)]
+
+    if jobs == 1 or len(chunks) <= 1:
+        results = [generateChunk(chunk, outputDir, options) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(generateChunk, chunks, [outputDir]*len(chunks), [options]*len(chunks)))
+
+    for index, entry in zip(todo, (entry for chunk in results for entry in chunk)):
+        manifest[index] = entry
+        if cache is not None:
+            cache.put(rowKey(rows[index][1], options), cacheEntry(entry))
+
+    for index, original in duplicates:
+        manifest[index] = copyOutputs(rows[index][0], manifest[original], outputDir)
+
+    return manifest
+
+def cacheEntry(entry : dict) -> dict:
+    # manifest entry without the per-run fields, plus the file contents
+    value = { k : v for k, v in entry.items() if k not in ("name", "outputs", "timing") }
+    value["outputs"] = {}
+    for fmt, fileName in entry["outputs"].items():
+        with open(fileName, "rb") as f:
+            value["outputs"][fmt] = f.read()
+    return value
+
+def writeCached(name : str, params : SprocketParameters, cached : dict, outputDir : str, options : BatchOptions) -> dict:
+    entry = { "name" : name, "parameters" : params._asdict() }
+    entry.update((k, v) for k, v in cached.items() if k not in ("parameters", "outputs"))
+    entry["outputs"] = {}
+    t0 = time.perf_counter()
+    for fmt in options.formats:
+        fileName = os.path.join(outputDir, "{:s}.{:s}".format(name, fmt))
+        with open(fileName, "wb") as f:
+            f.write(cached["outputs"][fmt])
+        entry["outputs"][fmt] = fileName
+    entry["timing"] = { "cached" : True, "write_s" : time.perf_counter() - t0 }
+    return entry
+
+def copyOutputs(name : str, original : dict, outputDir : str) -> dict:
+    entry = dict(original)
+    entry["name"] = name
+    entry["outputs"] = {}
+    for fmt, source in original["outputs"].items():
+        fileName = os.path.join(outputDir, "{:s}.{:s}".format(name, fmt))
+        if fileName != source:
+            shutil.copyfile(source, fileName)
+        entry["outputs"][fmt] = fileName
+    entry["timing"] = { "duplicate_of" : original["name"] }
+    return entry
+
+def main(argv=None):
+    milling = MillingOptions()
+    parser = argparse.ArgumentParser(prog="tapesprocketdesigner batch",
+        description="Generate sprocket DXF/SVG/G-code/STL/3MF files from a CSV or JSONL parameter file.")
+    parser.add_argument("input", help="CSV or JSONL file with one design per row")
+    parser.add_argument("-o", "--output", default="output", help="output directory (default: %(default)s)")
+    parser.add_argument("-f", "--format", default="dxf,svg",
+        help="comma separated list of output formats: dxf, svg, gcode, stl, 3mf (default: %(default)s)")
+    parser.add_argument("--dxf", choices=DXF_ENGINES, default="stream", dest="dxf_engine",
+        help="DXF output: streamed LINE entities, a single streamed LWPOLYLINE, "
+        "or LINE entities written through ezdxf (default: %(default)s)")
+    parser.add_argument("--tessellate", type=float, default=None, metavar="TOLERANCE",
+        help="write arcs as chords within this tolerance instead of true DXF/SVG arcs")
+    parser.add_argument("--svg-precision", type=int, default=3,
+        help="number of decimals in SVG coordinates (default: %(default)s)")
+    parser.add_argument("--tool-dia", type=float, default=None,
+        help="cutter diameter: G-code follows the compensated outline, DXF files get drill hits "
+        "that remove the shoulders at the base of the flanks (required for gcode)")
+    parser.add_argument("--no-drills", action="store_true", help="leave out the shoulder drill hits")
+    parser.add_argument("--depth", type=float, default=milling.depth,
+        help="G-code cutting depth, usually the stock thickness (default: %(default)s)")
+    parser.add_argument("--step-down", type=float, default=milling.step_down,
+        help="G-code depth per pass (default: %(default)s)")
+    parser.add_argument("--feed", type=float, default=milling.feed,
+        help="G-code cutting feed per minute (default: %(default)s)")
+    parser.add_argument("--plunge-feed", type=float, default=milling.plunge_feed,
+        help="G-code plunge feed per minute (default: %(default)s)")
+    parser.add_argument("--safe-z", type=float, default=milling.safe_z,
+        help="G-code clearance height (default: %(default)s)")
+    parser.add_argument("--thickness", type=float, default=BatchOptions().thickness,
+        help="STL/3MF extrusion height (default: %(default)s)")
+    parser.add_argument("--bore", type=float, default=0.0, metavar="DIAMETER",
+        help="STL/3MF center hole diameter (default: none)")
+    parser.add_argument("--cache", default=None, metavar="FILE",
+        help="keep generated files in this cache file between runs")
+    parser.add_argument("--cache-size", type=int, default=10000,
+        help="maximum number of designs kept in the cache (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--chunk-size", type=int, default=None,
+        help="designs handed to a worker at a time (default: automatic)")
+    args = parser.parse_args(argv)
+
+    formats = tuple(fmt.strip().lower() for fmt in args.format.split(",") if fmt.strip())
+    for fmt in formats:
+        if fmt not in FORMATS:
+            parser.error("unknown output format '{:s}'".format(fmt))
+
+    try:
+        with span("parse"):
+            rows = readRows(args.input)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    t0 = time.perf_counter()
+    if args.tessellate is not None and args.tessellate <= 0:
+        parser.error("--tessellate needs a positive tolerance")
+
+    milling = None
+    if args.tool_dia is not None:
+        if args.tool_dia <= 0 or args.depth <= 0 or args.step_down <= 0:
+            parser.error("--tool-dia, --depth and --step-down must be positive")
+        milling = MillingOptions(args.tool_dia, args.depth, args.step_down, args.safe_z, args.feed,
+            args.plunge_feed, not args.no_drills)
+    elif "gcode" in formats:
+        parser.error("gcode output needs --tool-dia")
+
+    if args.thickness <= 0 or args.bore < 0:
+        parser.error("--thickness must be positive and --bore not negative")
+
+    options = BatchOptions(formats, args.dxf_engine, args.svg_precision, args.tessellate, milling,
+        args.thickness, args.bore)
+    cache = GeometryCache(args.cache_size, args.cache) if args.cache else None
+    manifest = runBatch(rows, args.output, options, args.jobs, args.chunk_size, cache)
+    elapsed = time.perf_counter() - t0
+
+    manifestName = os.path.join(args.output, "manifest.jsonl")
+    with open(manifestName, "w") as f:
+        for entry in manifest:
+            f.write(json.dumps(entry, allow_nan=False) + "\n")
+
+    invalid = [entry["name"] for entry in manifest if "geometry" in entry["errors"]]
+    print("{:d} designs written to {:s} in {:.2f} s".format(len(manifest) - len(invalid), args.output, elapsed))
+    if invalid:
+        print("{:d} invalid designs skipped: {:s}".format(len(invalid), ", ".join(invalid)))
+    if cache is not None:
+        cache.save()
+        print("cache: {hits:d} hits, {misses:d} misses, {evictions:d} evictions, {entries:d} entries".format(**cache.stats()))
+    return 0
@@ -0,0 +1,114 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Bounded LRU cache for computed geometry and rendered exports.
+#
+# Entries are keyed by the normalized parameter tuple (see cacheKey), plus
+# whatever else the value depends on, e.g. a tolerance or an output format.
+# The cache can optionally be persisted to a file between runs. The file
+# carries CACHE_VERSION, a file written with another version is discarded.
+
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from .geometry import SprocketParameters, computeSprocket
+
+# parameters are rounded to this many decimals, so that e.g. "4" and "4.0"
+# or values that only differ by float noise share an entry
+KEY_DECIMALS = 9
+
+# format of a persisted cache: bump it whenever the cached values, or the
+# geometry and exports they were computed with, change
+CACHE_VERSION = 1
+
+def cacheKey(params : SprocketParameters, *extra) -> tuple:
+    params = SprocketParameters(*params)
+    return (int(params.n_teeth),) + tuple(round(float(v), KEY_DECIMALS) + 0.0 for v in params[1:]) + extra
+
+class GeometryCache:
+
+    def __init__(self, maxEntries : int = 256, fileName : str = None):
+        self.maxEntries = maxEntries
+        self.fileName = fileName
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if fileName and os.path.exists(fileName):
+            self.load(fileName)
+
+    def get(self, key):
+        # returns None on a miss
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def getOrCompute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def sprocket(self, params : SprocketParameters):
+        return self.getOrCompute(cacheKey(params, "sprocket"), lambda: computeSprocket(params))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries" : len(self.entries),
+                "max_entries" : self.maxEntries,
+                "hits" : self.hits,
+                "misses" : self.misses,
+                "evictions" : self.evictions
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def load(self, fileName : str):
+        # a damaged, incompatible or outdated cache file is ignored, the cache just starts empty
+        try:
+            with open(fileName, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return
+        entries = data.get("entries")
+        if not isinstance(entries, OrderedDict):
+            return
+
+        with self.lock:
+            self.entries = entries
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def save(self, fileName : str = None):
+        fileName = fileName or self.fileName
+        if not fileName:
+            return
+        with self.lock:
+            data = pickle.dumps({ "version" : CACHE_VERSION, "entries" : self.entries }, protocol=pickle.HIGHEST_PROTOCOL)
+        tmpName = fileName + ".tmp"
+        with open(tmpName, "wb") as f:
+            f.write(data)
+        os.replace(tmpName, fileName)
@@ -0,0 +1,51 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Command line entry point. This module stays light on purpose: a subcommand
+# only imports its own module, and Qt is only loaded when the GUI is started.
+#
+# --profile[=FILE] and --cprofile[=FILE] are accepted with the GUI and with
+# every subcommand, see profiling.py.
+
+import importlib
+import sys
+
+from . import profiling
+
+# subcommand -> module providing main(argv)
+SUBCOMMANDS = {
+    "batch" : "batch",
+    "solve" : "solver",
+    "nest" : "nesting",
+    "serve" : "server",
+    "thumbs" : "thumbnails",
+}
+
+# default cProfile output for a bare --cprofile
+CPROFILE_OUTPUT = "tapesprocketdesigner.prof"
+
+def popOption(argv : list, name : str, default : str):
+    # removes --name or --name=VALUE from argv; returns VALUE, 'default' for a bare --name, or None
+    for index, arg in enumerate(argv):
+        if arg == name:
+            del argv[index]
+            return default
+        if arg.startswith(name + "="):
+            del argv[index]
+            return arg[len(name) + 1:]
+    return None
+
+def main():
+    argv = sys.argv[1:]
+    profiling.configure(popOption(argv, "--profile", "1"), popOption(argv, "--cprofile", CPROFILE_OUTPUT))
+    sys.argv[1:] = argv
+
+    try:
+        if len(argv) > 0 and argv[0] in SUBCOMMANDS:
+            module = importlib.import_module("." + SUBCOMMANDS[argv[0]], __package__)
+            sys.exit(module.main(argv[1:]))
+
+        from .designer import main as designerMain
+        designerMain()
+    finally:
+        profiling.finish()
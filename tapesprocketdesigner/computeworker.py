@@ -0,0 +1,57 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Runs the sprocket geometry on a QThreadPool so the GUI thread never blocks.
+#
+# Every request carries a generation number. A worker whose generation is no
+# longer the latest one when it starts does not compute anything, and the
+# receiver drops results that arrive for an older generation. Invalid
+# parameters are reported too, with None for all results, so that the
+# receiver stops showing the previous design.
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from .geometry import SprocketParameters
+from .cache import GeometryCache, cacheKey
+from .engagement import checkEngagement
+from .profiling import span
+
+class ComputeSignals(QObject):
+
+    # generation, Sprocket, tessellated Outline for the canvas, EngagementReport;
+    # all None when the parameters do not describe a valid sprocket
+    finished = Signal(int, object, object, object)
+
+class ComputeWorker(QRunnable):
+
+    def __init__(self, params : SprocketParameters, tolerance : float, cache : GeometryCache,
+        generation : int, latestGeneration):
+        super(ComputeWorker, self).__init__()
+        self.params = params
+        self.tolerance = tolerance
+        self.cache = cache
+        self.generation = generation
+        self.latestGeneration = latestGeneration    # callable returning the newest generation
+        self.signals = ComputeSignals()
+
+    def run(self):
+        if self.generation != self.latestGeneration():
+            return
+
+        try:
+            with span("geometry"):
+                sprocket = self.cache.sprocket(self.params)
+            if not sprocket.isValid():
+                self.signals.finished.emit(self.generation, None, None, None)
+                return
+            with span("geometry.tessellate"):
+                outline = self.cache.getOrCompute(cacheKey(self.params, "outline", self.tolerance),
+                    lambda: sprocket.outline.tessellate(self.tolerance))
+            with span("geometry.engagement"):
+                engagement = self.cache.getOrCompute(cacheKey(self.params, "engagement"),
+                    lambda: checkEngagement(sprocket))
+        except (ValueError, ZeroDivisionError):
+            self.signals.finished.emit(self.generation, None, None, None)
+            return
+
+        self.signals.finished.emit(self.generation, sprocket, outline, engagement)
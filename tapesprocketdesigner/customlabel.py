@@ -1,9 +1,8 @@
 # Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
 # SPDX-License-Identifier: GPL-3.0-only
 
-from PySide6.QtWidgets import *
-from PySide6.QtGui import *
-from PySide6.QtCore import *
+from PySide6.QtWidgets import QLabel
+from PySide6.QtCore import Signal, QEvent
 
 class CustomLabel(QLabel):
 
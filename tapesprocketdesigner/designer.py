@@ -3,18 +3,43 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
 import sys
-import math
-import ezdxf
-from ezdxf import units
-import svgwrite
 
-from PySide6.QtWidgets import *
-from PySide6.QtGui import *
-from PySide6.QtCore import Qt, QPointF
-
-from version import *
-from customlabel import *
-from sprocketcanvas import *
+from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QHBoxLayout, QVBoxLayout,
+    QGridLayout, QGroupBox, QSizePolicy, QSpacerItem, QLabel, QLineEdit, QPushButton, QFileDialog,
+    QListWidget, QListWidgetItem, QCheckBox, QComboBox, QMessageBox)
+from PySide6.QtGui import QIntValidator
+from PySide6.QtCore import Qt, QTimer, QThreadPool
+
+try:
+    from .version import version
+except ImportError:
+    # version.py is generated by update_version.py when building a release
+    version = "dev"
+from . import profiling
+from .geometry import SprocketParameters
+from .computeworker import ComputeWorker
+from .cache import GeometryCache, cacheKey
+from .solver import solveDesigns
+from .outline import Outline, UNIT_CONVERSIONS
+from .toolpath import MillingOptions, computeToolpath, shoulderDrills
+from .nesting import nestSheets
+from .exporters import writeDXF, writeSVG, writeGCode, writeSTL, write3MF, writeSheetDXF, writeSheetSVG
+from .customlabel import CustomLabel
+from .sprocketcanvas import SprocketCanvas
+
+# largest number of teeth accepted by the GUI
+MAX_TEETH = 100
+
+# delay between the last keystroke and the live recompute
+COMPUTE_DEBOUNCE_MS = 150
+
+# number of recently computed designs kept around, e.g. when toggling a value back and forth
+GEOMETRY_CACHE_SIZE = 64
+
+# with profiling enabled, the status bar shows the last duration of these spans
+STATUS_SPANS = ("parse", "geometry", "geometry.tessellate", "geometry.engagement", "canvas.update",
+    "canvas.render", "canvas.paint")
+STATUS_INTERVAL_MS = 500
 
 class MainWindow(QMainWindow):
 
@@ -39,7 +64,7 @@ class MainWindow(QMainWindow):
 
         gridLayout.addWidget(QLabel("# of teeth"), 0,0)
         self.numTeeth = QLineEdit("14")
-        self.numTeeth.setValidator(QIntValidator(1,100, self))
+        self.numTeeth.setValidator(QIntValidator(1,MAX_TEETH, self))
         gridLayout.addWidget(self.numTeeth, 0,1)
 
         gridLayout.addWidget(QLabel("Tooth width/diameter"), 1,0)
@@ -62,6 +87,12 @@ class MainWindow(QMainWindow):
         gridLayout.addWidget(self.toothLengthPct, 4,1)
         gridLayout.addWidget(QLabel("percent"), 4,2)
 
+        gridLayout.addWidget(QLabel("Arc tolerance"), 5,0)
+        self.arcTolerance = QLineEdit("0.01")
+        self.arcTolerance.setToolTip("Maximum deviation of the displayed outline from the true arcs")
+        gridLayout.addWidget(self.arcTolerance, 5,1)
+        gridLayout.addWidget(QLabel("mm"), 5,2)
+
         # setup Report group
 
         self.reportGrp = QGroupBox("Report")
@@ -103,6 +134,90 @@ class MainWindow(QMainWindow):
         gridLayout2.addWidget(self.maxOuterDiameter, 3,1)
         gridLayout2.addWidget(QLabel("mm"), 3,2)        
 
+        gridLayout2.addWidget(QLabel("Tape clearance"), 4,0)
+        self.tapeClearance = QLabel("N/A")
+        self.tapeClearance.setToolTip("Smallest distance between the teeth and the sprocket hole edges\n"
+            "while the tape leaves the sprocket tangentially; negative when a tooth cuts into the tape")
+        gridLayout2.addWidget(self.tapeClearance, 4,1)
+        gridLayout2.addWidget(QLabel("mm"), 4,2)
+
+        # setup Extra Options group
+        self.extraOptionsGrp = QGroupBox("Extra Options")
+        self.extraOptionsGrp.setSizePolicy(QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum)
+        panelLayout.addWidget(self.extraOptionsGrp)
+
+        gridLayout4 = QGridLayout()
+        self.extraOptionsGrp.setLayout(gridLayout4)
+
+        self.cutterLeftovers = QCheckBox("Remove cutter leftovers")
+        self.cutterLeftovers.setToolTip("Add drill hits that remove the shoulders a round cutter leaves at the base of the flanks")
+        gridLayout4.addWidget(self.cutterLeftovers, 0,0,1,3)
+
+        gridLayout4.addWidget(QLabel("Cutter diameter"), 1,0)
+        self.cutterDiameter = QLineEdit("1")
+        gridLayout4.addWidget(self.cutterDiameter, 1,1)
+        gridLayout4.addWidget(QLabel("mm"), 1,2)
+
+        gridLayout4.addWidget(QLabel("Stock thickness"), 2,0)
+        self.stockThickness = QLineEdit("3")
+        gridLayout4.addWidget(self.stockThickness, 2,1)
+        gridLayout4.addWidget(QLabel("mm"), 2,2)
+
+        gridLayout4.addWidget(QLabel("Pass depth"), 3,0)
+        self.passDepth = QLineEdit("1")
+        gridLayout4.addWidget(self.passDepth, 3,1)
+        gridLayout4.addWidget(QLabel("mm"), 3,2)
+
+        gridLayout4.addWidget(QLabel("Feed rate"), 4,0)
+        self.feedRate = QLineEdit("300")
+        gridLayout4.addWidget(self.feedRate, 4,1)
+        gridLayout4.addWidget(QLabel("mm/min"), 4,2)
+
+        gridLayout4.addWidget(QLabel("Bore diameter"), 5,0)
+        self.boreDiameter = QLineEdit("0")
+        self.boreDiameter.setToolTip("Hole in the center of STL/3MF models, 0 for none")
+        gridLayout4.addWidget(self.boreDiameter, 5,1)
+        gridLayout4.addWidget(QLabel("mm"), 5,2)
+
+        gridLayout4.addWidget(QLabel("Unit conversion"), 6,0)
+        self.unitConversion = QComboBox()
+        self.unitConversion.addItems(list(UNIT_CONVERSIONS))
+        self.unitConversion.setToolTip("Applied when writing DXF and G-code files")
+        gridLayout4.addWidget(self.unitConversion, 6,1,1,2)
+
+        # setup Sheet group: many copies of the design nested on one sheet
+        self.sheetGrp = QGroupBox("Sheet")
+        self.sheetGrp.setSizePolicy(QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum)
+        panelLayout.addWidget(self.sheetGrp)
+
+        gridLayout5 = QGridLayout()
+        self.sheetGrp.setLayout(gridLayout5)
+
+        gridLayout5.addWidget(QLabel("Sheet width"), 0,0)
+        self.sheetWidth = QLineEdit("600")
+        gridLayout5.addWidget(self.sheetWidth, 0,1)
+        gridLayout5.addWidget(QLabel("mm"), 0,2)
+
+        gridLayout5.addWidget(QLabel("Sheet height"), 1,0)
+        self.sheetHeight = QLineEdit("300")
+        gridLayout5.addWidget(self.sheetHeight, 1,1)
+        gridLayout5.addWidget(QLabel("mm"), 1,2)
+
+        gridLayout5.addWidget(QLabel("Kerf"), 2,0)
+        self.sheetKerf = QLineEdit("0.2")
+        self.sheetKerf.setToolTip("Gap between the parts and to the sheet edges")
+        gridLayout5.addWidget(self.sheetKerf, 2,1)
+        gridLayout5.addWidget(QLabel("mm"), 2,2)
+
+        gridLayout5.addWidget(QLabel("Copies"), 3,0)
+        self.sheetCopies = QLineEdit("10")
+        self.sheetCopies.setValidator(QIntValidator(1, 100000, self))
+        gridLayout5.addWidget(self.sheetCopies, 3,1)
+
+        self.exportSheetButton = QPushButton("Export sheet")
+        self.exportSheetButton.pressed.connect(self.onWriteSheet)
+        gridLayout5.addWidget(self.exportSheetButton, 4,0,1,3)
+
         # Export to DXF button
         buttonLayout = QHBoxLayout()
 
@@ -116,8 +231,51 @@ class MainWindow(QMainWindow):
         self.exportSVFButton.pressed.connect(self.onWriteSVG)
         buttonLayout.addWidget(self.exportSVFButton)
 
+        self.exportGCodeButton = QPushButton("Export to G-code")
+        self.exportGCodeButton.setSizePolicy(QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum)
+        self.exportGCodeButton.pressed.connect(self.onWriteGCode)
+        buttonLayout.addWidget(self.exportGCodeButton)
+
+        self.exportMeshButton = QPushButton("Export to STL/3MF")
+        self.exportMeshButton.setSizePolicy(QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum)
+        self.exportMeshButton.pressed.connect(self.onWriteMesh)
+        buttonLayout.addWidget(self.exportMeshButton)
+
         panelLayout.addLayout(buttonLayout)
 
+        # enabled while a valid design is shown
+        self.exportButtons = (self.exportDXFButton, self.exportSVFButton, self.exportGCodeButton,
+            self.exportMeshButton, self.exportSheetButton)
+        for button in self.exportButtons:
+            button.setEnabled(False)
+
+        # setup Solver group: find teeth count and tooth length for a target outer diameter
+        self.solverGrp = QGroupBox("Fit outer diameter")
+        self.solverGrp.setSizePolicy(QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum)
+        panelLayout.addWidget(self.solverGrp)
+
+        gridLayout3 = QGridLayout()
+        self.solverGrp.setLayout(gridLayout3)
+
+        gridLayout3.addWidget(QLabel("Min. outer diameter"), 0,0)
+        self.solverMinOuter = QLineEdit("20")
+        gridLayout3.addWidget(self.solverMinOuter, 0,1)
+        gridLayout3.addWidget(QLabel("mm"), 0,2)
+
+        gridLayout3.addWidget(QLabel("Max. outer diameter"), 1,0)
+        self.solverMaxOuter = QLineEdit("22")
+        gridLayout3.addWidget(self.solverMaxOuter, 1,1)
+        gridLayout3.addWidget(QLabel("mm"), 1,2)
+
+        self.solverButton = QPushButton("Find designs")
+        self.solverButton.pressed.connect(self.onSolve)
+        gridLayout3.addWidget(self.solverButton, 2,0,1,3)
+
+        self.solverResults = QListWidget()
+        self.solverResults.setToolTip("Click a design to use it")
+        self.solverResults.itemClicked.connect(self.onSolverResultClicked)
+        gridLayout3.addWidget(self.solverResults, 3,0,1,3)
+
         panelLayout.addSpacerItem(QSpacerItem(0,0, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.MinimumExpanding))
 
         # Generate the right sprocket display
@@ -137,15 +295,32 @@ class MainWindow(QMainWindow):
         # add everything to the main window
         self.setCentralWidget(self.mainWidget)
 
-        # Connect up the GUI widgets
-        self.numTeeth.editingFinished.connect(self.computeGear)
-        self.toothDiameter.editingFinished.connect(self.computeGear)
-        self.toothSpacing.editingFinished.connect(self.computeGear)
-        self.toothFlankHeight.editingFinished.connect(self.computeGear)
-        self.toothLengthPct.editingFinished.connect(self.computeGear)
+        if profiling.isEnabled():
+            self.statusTimer = QTimer(self)
+            self.statusTimer.setInterval(STATUS_INTERVAL_MS)
+            self.statusTimer.timeout.connect(self.onStatusTimer)
+            self.statusTimer.start()
+
+        # Connect up the GUI widgets: recompute while typing, after a short pause,
+        # and right away when editing is finished
+        self.computeTimer = QTimer(self)
+        self.computeTimer.setSingleShot(True)
+        self.computeTimer.setInterval(COMPUTE_DEBOUNCE_MS)
+        self.computeTimer.timeout.connect(self.computeGear)
+
+        for edit in (self.numTeeth, self.toothDiameter, self.toothSpacing, self.toothFlankHeight, self.toothLengthPct,
+            self.arcTolerance):
+            edit.textEdited.connect(self.computeTimer.start)
+            edit.editingFinished.connect(self.computeGear)
+
+        self.computePool = QThreadPool(self)
+        self.computePool.setMaxThreadCount(1)
+        self.computeGeneration = 0
+        self.computeKey = None
+        self.geometryCache = GeometryCache(GEOMETRY_CACHE_SIZE)
 
         # init data
-        self.lines = []
+        self.sprocket = None
         self.max_outer_radius = 0
         self.inner_radius = 0
         self.outer_radius = 0
@@ -153,212 +328,240 @@ class MainWindow(QMainWindow):
         self.show()
 
     def computeGear(self):
-        n_teeth   = float(self.numTeeth.text())
-        tooth_dia = float(self.toothDiameter.text())
-        tooth_pitch = float(self.toothSpacing.text())
-        flank_height = float(self.toothFlankHeight.text())
-        tooth_length_pct = float(self.toothLengthPct.text())
-
-        #Process:
-        # Generate a single tooth: taper edges so that (leftedge-to-rightedge) distance is no greater than the outer-to-outer distance at the base of the tooth: 'undo' the splay caused by the teeth being on an arc.
-        # This splay is given by the angle that subtends the arc bounded by the outer edges of the tooth (straight part at top of "design" radius). This is the center-to-center arc length + the arc 'inside' one tooth (1/2 tooth on the outside of each center).
-        # But we already know the *angle* formed by the center-to-center tooth pitch: (360/nTeeth), so we only need to find the arc length inside one tooth and its resulting angle, and add this to the pitch angle.
-
-        # Intratooth arc angle in degrees: (360/pi) * asin(C / 2r), where C = chord length.
-
-        # So the outer (as well as inner) surface of each tooth must come in 1/2 that amount (relative to radial / sticking straight out).
-
-
-
-        # Generate important radii: what I'm calling "design" radius (top of tooth flank; widest point of "where the tape sits"). For thin tapes this is approximately the same as inner radius, but we may as well go ahead and calculate it.
-        # Inner radius
-        # Maximum outer radius. This is where the tooth comes to a point at the given face angle. The final outer radius can be chosen anywhere between design radius and maximum outer radius (tops of teeth will be cut off).
-
-        # Design radius: ((nTeeth*pitch) / (2*pi))
-        # Inner radius: ((nTeeth*pitch) / (2*pi)) - flank height
-
-        # Outer radius: design radius + tooth face height
-        # Tooth inner angle is 90 - outer angle, so, tooth face height: tan(90-angle) = h / (w/2) --> h = (w/2)*tan(90-angle)
-
-        ####FIXME: Tooth auto-angle currently broken. Making two adjacent teeth 'straight' on their outside edges is not enough!
-
-        # Calculate where the nominal teeth intersect these circles and generate lines between them.
-
-
-        design_circumference = n_teeth * tooth_pitch
-        self.design_radius = design_circumference / (2.0*math.pi)
-        self.inner_radius = self.design_radius - flank_height
-
-        # get the allowed range for the outer radius
-        # to do this, need to get (or suggest) the tooth angle. This will be related to 'splay' described above.
-        # Unless the user has chosen (or overridden) a desired angle, calculate and use the recommended value
-
-        chord_angle = 2.0 * (180.0/math.pi) * math.asin(tooth_dia / (2.0 * self.design_radius))
-
-        #try:
-        #    tooth_outer_angle = float(toothFaceAngleValue.get())
-        #    tooth_inner_angle = 90.0 - tooth_outer_angle - (chord_angle / 2.0)
-        #except ValueError:
-        tooth_outer_angle = (chord_angle + (360.0 / n_teeth)) / 4.0 # half the equidistant-to-two-teeth to edge-of-tooth angle -> 1/4 of edge-to-edge angle
-        tooth_inner_angle = 90.0 - tooth_outer_angle - (chord_angle / 2.0)
-            #toothFaceAngleValue.set(str(tooth_outer_angle))
-
-        #print("Tooth centers angle: {:f}".format(360.0/n_teeth))
-        #print("Tooth width contribution: {:f}".format(chord_angle))
-        #print("Tooth edges angle: {:f}".format((360.0/n_teeth) + chord_angle))
-
-        #print("Design circumference = {:f} radius = {:f}".format(design_circumference, design_radius))
-        #print("Min. tooth angle: {:f} degrees from vertical".format(tooth_outer_angle))
-
-        tooth_face_height = (tooth_dia / 2.0) * math.tan(tooth_inner_angle * (math.pi / 180.0))
-        self.max_outer_radius = self.design_radius + tooth_face_height
-
-        self.outer_radius = self.design_radius + ((self.max_outer_radius - self.design_radius) * (tooth_length_pct/100.0)) #design_radius + (design_radius*0.5) #self.max_outer_radius
-
-        #print("Resulting tooth height (angled portion) = {:f}".format(tooth_face_height))
-        #print("Outer radius = {:f}".format(self.max_outer_radius))
-
-        # From list of tooth centers...
-        # Flank (starts,ends): tooth center +/- tooth chordal angle
-        # Faces: Remember, working in polar coords. Doublecheck this, but I think where the angle of the ray intersecting the "end of face" (between 0 and chord_angle/2 relative to tooth center) falls will be proportional to where end of face falls between design radius and max. outer radius.
-
-        face_ratio = (self.outer_radius - self.design_radius) / (self.max_outer_radius - self.design_radius) # will produce a result between 0 and 1
-
-        # Actual angle will be the inverse of this, since where user outer = max outer, angle is 0.
-
-        tooth_ending_angle = (1 - face_ratio) * (chord_angle / 2)
-
-        tooth_centers = []
-
-        for i in range(0, int(n_teeth)):
-            tooth_centers.append((360.0 / n_teeth) * i)
-
-        # For each tooth:
-        #   line(start of flank ~ end of flank)
-        #   line(end of flank (start of face) ~ where face intersects outer radius)
-        #   line/arc(first ~ second face intersection with outer radius)
-        #   reverse of the above (end and start of face, flank)
-        #   arc(end of flank ~ start of next tooth's flank)
-
-        # pairs of (r,theta) for line starting and ending point
-        polar_lines = []
-
-        for i in tooth_centers:
-        # Polar angles are usually considered increasing counterclockwise, with zero "to the right" - we'll do the same,
-        # going from righthand side to lefthand side of each tooth.
-        # Right flank
-            polar_lines.append([ [self.inner_radius, i-(chord_angle/2)], [self.design_radius, i-(chord_angle/2)] ])
-        # Right face
-            polar_lines.append([ [self.design_radius, i-(chord_angle/2)], [self.outer_radius, i-tooth_ending_angle] ])
-        # blunted tip
-            polar_lines.append([ [self.outer_radius, i-tooth_ending_angle], [self.outer_radius, i+tooth_ending_angle] ])
-        # left face
-            polar_lines.append([ [self.outer_radius, i+tooth_ending_angle], [self.design_radius, i+(chord_angle/2)] ])
-        # left flank
-            polar_lines.append([ [self.design_radius, i+(chord_angle/2)], [self.inner_radius, i+(chord_angle/2)] ])
-        # finally, the space between this and the next tooth
-            polar_lines.append([ [self.inner_radius, i+(chord_angle/2)], [self.inner_radius, i+(360.0/n_teeth)-(chord_angle/2)] ])
-
-
-        # if cutter crap-removal on: remove the shoulder left behind when outside-pocketing concave portions; in this case where the tooth flanks meet the inner radius.
-        # cut (d/2) below the radius, then across by at least d (+ ballhair?) to ensure pocket algorithm will allow cutting in there, then back to inner radius.
-        # It is an error if d exceeds the distance between teeth.
-
-        # Hmm... will also fail if d exceeds 1/2 distance between teeth, and makes more math for me. For now just add drills that will take the shoulders off.
-
-        polar_comp_drills = []
-
+        self.computeTimer.stop()
         try:
-            #comp_r = float(cutterDiaLabelValue.get()) / 2.0
-            comp_r = float(0.0) / 2.0
-            for i in tooth_centers:
-                # at end of this tooth
-                # put the hole center @ inside diameter line, 1 cutter radius from edge of tooth
-                polar_comp_drills.append([self.inner_radius, i+(chord_angle/2) + (360*comp_r/(2*math.pi*(self.inner_radius - comp_r)))])
-                # at start of next tooth
-                polar_comp_drills.append([self.inner_radius , i+(360.0/n_teeth)-(chord_angle/2) - (360*comp_r/(2*math.pi*(self.inner_radius - comp_r)))])
+            with profiling.span("parse"):
+                params = SprocketParameters(
+                    n_teeth = int(self.numTeeth.text()),
+                    tooth_dia = float(self.toothDiameter.text()),
+                    tooth_pitch = float(self.toothSpacing.text()),
+                    flank_height = float(self.toothFlankHeight.text()),
+                    tooth_length_pct = float(self.toothLengthPct.text()))
+                tolerance = float(self.arcTolerance.text())
+            if tolerance <= 0:
+                return
         except ValueError:
-            comp_r = 0
-
-        self.lines = []
-        rect_comp_drills = []
-
-        for i in polar_lines:
-            self.lines.append([self.p2r(i[0][0],i[0][1]),  self.p2r(i[1][0],i[1][1])])
-
-        for i in polar_comp_drills:
-            rect_comp_drills.append(self.p2r(i[0],i[1]))
-
-        self.sprocketCanvas.setLines(self.lines, self.outer_radius)
+            # incomplete input while typing, keep showing the last result
+            return
+
+        # editingFinished also fires when nothing changed
+        key = cacheKey(params, tolerance)
+        if key == self.computeKey:
+            return
+        self.computeKey = key
+
+        # all the sprocket math lives in geometry.py and runs on the worker thread;
+        # only the result of the latest request is shown
+        self.computeGeneration += 1
+        worker = ComputeWorker(params, tolerance, self.geometryCache, self.computeGeneration,
+            lambda: self.computeGeneration)
+        worker.signals.finished.connect(self.onComputeFinished)
+        self.computePool.start(worker)
+
+    def onComputeFinished(self, generation : int, sprocket, outline, engagement):
+        if generation != self.computeGeneration:
+            return
+
+        with profiling.span("canvas.update"):
+            self.showResult(sprocket, outline, engagement)
+
+    def showResult(self, sprocket, outline, engagement):
+        for button in self.exportButtons:
+            button.setEnabled(sprocket is not None)
+        if sprocket is None:
+            self.showInvalid()
+            return
+
+        self.design_radius = sprocket.design_radius
+        self.inner_radius = sprocket.inner_radius
+        self.outer_radius = sprocket.outer_radius
+        self.max_outer_radius = sprocket.max_outer_radius
+        self.sprocket = sprocket
+
+        self.sprocketCanvas.setOutline(outline, self.outer_radius)
 
         self.innerDiameter.setText("{:.3f}".format(self.inner_radius * 2))
         self.designDiameter.setText("{:.3f}".format(self.design_radius * 2))
         self.outerDiameter.setText("{:.3f}".format(self.outer_radius * 2))
         self.maxOuterDiameter.setText("{:.3f}".format(self.max_outer_radius * 2))
 
-    def p2r(self, r, theta):
-        #python's builtin math functions work in radians, so convert...
-        theta = theta * (math.pi / 180.0)
-        return r*math.cos(theta), r*math.sin(theta)
-
-    def p2r_tuple(self, r, theta):
-        #python's builtin math functions work in radians, so convert...
-        theta = theta * (math.pi / 180.0)
-        return (r*math.cos(theta), r*math.sin(theta))
-
-    def dist(self, xy1, xy2):
-        dist_x = abs(xy1[0] - xy2[0])
-        dist_y = abs(xy1[1] - xy2[1])
-        distance = math.sqrt((dist_x*dist_x) + (dist_y*dist_y))
-        return distance
+        self.tapeClearance.setText("{:.3f}".format(engagement.min_clearance))
+        if engagement.colliding_positions:
+            self.tapeClearance.setStyleSheet("color: red")
+            self.tapeClearance.setToolTip("Teeth {:s} past the tangent point cut into the tape, worst at {:.1f} degrees".format(
+                ", ".join(str(p + 1) for p in engagement.colliding_positions), engagement.worst_angle))
+        else:
+            self.tapeClearance.setStyleSheet("")
+            self.tapeClearance.setToolTip("No tooth touches the tape outside its sprocket hole")
+
+    def showInvalid(self):
+        # the parameters do not describe a valid sprocket: nothing to show or export
+        self.sprocket = None
+        self.design_radius = self.inner_radius = self.outer_radius = self.max_outer_radius = 0
+        self.sprocketCanvas.setOutline(None, self.sprocketCanvas.userOuterRadius)
+        for label in (self.innerDiameter, self.designDiameter, self.outerDiameter, self.maxOuterDiameter,
+            self.tapeClearance):
+            label.setText("invalid")
+        self.tapeClearance.setStyleSheet("")
+        self.tapeClearance.setToolTip("The parameters do not describe a valid sprocket")
+
+    def onStatusTimer(self):
+        self.statusBar().showMessage(profiling.statusLine(STATUS_SPANS))
 
     def onWriteDXF(self):
-        if not self.sprocketCanvas.getLines():
+        if self.sprocket is None:
             return            
 
+        outline = self.sprocket.outline
+        if self.cutterLeftovers.isChecked():
+            options = self.millingOptions()
+            if options is None:
+                return
+            outline = Outline(outline.vertices, outline.bulges, shoulderDrills(self.sprocket, options.tool_dia))
+
         fileName, _ = QFileDialog.getSaveFileName(self, "Export as DXF","","DXF Files (*.dxf)")
         if fileName:
-            doc = ezdxf.new("R2000")
-            doc.units = units.MM
-            msp = doc.modelspace()
-
-            for L in self.lines:
-                pstart = (L[0][0], L[0][1])
-                pstop  = (L[1][0], L[1][1])
-                msp.add_line(pstart, pstop)
-
-            doc.saveas(fileName)
+            writeDXF(fileName, outline, conversion=self.unitConversion.currentText())
 
     def onWriteSVG(self):
-        if not self.sprocketCanvas.getLines():
+        if self.sprocket is None:
             return            
 
         fileName, _ = QFileDialog.getSaveFileName(self, "Export as SVG","","SVG Files (*.svg)")
         if fileName:
-            w = self.max_outer_radius * 2
-            h = self.max_outer_radius * 2
-            dwg = svgwrite.Drawing(fileName, size=('{:f}mm'.format(w), '{:f}mm'.format(h)),
-                viewBox=('0 0 {:f} {:f}').format(w,h))
+            writeSVG(fileName, self.sprocket.outline, self.max_outer_radius)
+
+    def onWriteGCode(self):
+        if self.sprocket is None:
+            return
+
+        options = self.millingOptions()
+        if options is None:
+            return
+        if not self.sprocket.isValid():
+            QMessageBox.warning(self, "Export to G-code", "The parameters do not describe a valid sprocket.")
+            return
+        try:
+            toolpath = computeToolpath(self.sprocket, options)
+        except ValueError:
+            QMessageBox.warning(self, "Export to G-code", "The cutter does not fit between the teeth.")
+            return
 
-            p = dwg.path(stroke=svgwrite.rgb(0, 0, 0, '%'), stroke_width=0.25)
+        fileName, _ = QFileDialog.getSaveFileName(self, "Export as G-code","","G-code Files (*.nc *.gcode)")
+        if fileName:
+            writeGCode(fileName, toolpath, options, self.unitConversion.currentText())
 
-            firstCoordinate = True
-            for L in self.lines:
-                px = w/2 + L[0][0]
-                py = h/2 + L[0][1]
-                if firstCoordinate:
-                    p.push("M {:f} {:f}". format(px,py))
-                    firstCoordinate = False
-                else:
-                    p.push(" {:f} {:f}". format(px,py))
+    def onWriteMesh(self):
+        if self.sprocket is None:
+            return
 
-                #pstart = (w/2 + L[0][0], h/2 + L[0][1])
-                #pstop  = (w/2 + L[1][0], h/2 + L[1][1])
-                #dwg.add(dwg.line(pstart, pstop, stroke=svgwrite.rgb(0, 0, 0, '%'), stroke_width=0.25))
+        # extruded to the stock thickness, arcs tessellated like on screen
+        try:
+            thickness = float(self.stockThickness.text())
+            bore_dia = float(self.boreDiameter.text())
+            tolerance = float(self.arcTolerance.text())
+        except ValueError:
+            thickness = 0
+        if thickness <= 0 or bore_dia < 0 or tolerance <= 0:
+            QMessageBox.warning(self, "Export to STL/3MF", "Stock thickness and arc tolerance must be positive, the bore diameter must not be negative.")
+            return
+        if bore_dia >= self.inner_radius * 2:
+            QMessageBox.warning(self, "Export to STL/3MF", "The bore must be smaller than the inner diameter.")
+            return
+
+        fileName, selected = QFileDialog.getSaveFileName(self, "Export as STL or 3MF","","STL Files (*.stl);;3MF Files (*.3mf)")
+        if not fileName:
+            return
+        writer = write3MF if fileName.lower().endswith(".3mf") or \
+            (selected.startswith("3MF") and not fileName.lower().endswith(".stl")) else writeSTL
+        try:
+            writer(fileName, self.sprocket.outline, thickness, bore_dia, tolerance)
+        except ValueError as e:
+            QMessageBox.warning(self, "Export to STL/3MF", "The outline cannot be extruded: {:s}".format(str(e)))
 
-            dwg.add(p)
+    def onWriteSheet(self):
+        if self.sprocket is None:
+            return
 
-            dwg.save()            
+        try:
+            width = float(self.sheetWidth.text())
+            height = float(self.sheetHeight.text())
+            kerf = float(self.sheetKerf.text())
+            copies = int(self.sheetCopies.text())
+        except ValueError:
+            width = 0
+        if width <= 0 or height <= 0 or kerf < 0 or copies < 1:
+            QMessageBox.warning(self, "Export sheet", "Enter the sheet size, the kerf and the number of copies.")
+            return
+        if not self.sprocket.isValid():
+            QMessageBox.warning(self, "Export sheet", "The parameters do not describe a valid sprocket.")
+            return
+
+        outlines = [self.sprocket.outline] * copies
+        sheets, rejected = nestSheets(outlines, width, height, kerf, maxSheets=1)
+        if not sheets:
+            QMessageBox.warning(self, "Export sheet", "The sprocket does not fit on the sheet.")
+            return
+
+        fileName, selected = QFileDialog.getSaveFileName(self, "Export sheet","","DXF Files (*.dxf);;SVG Files (*.svg)")
+        if not fileName:
+            return
+        if fileName.lower().endswith(".svg") or (selected.startswith("SVG") and not fileName.lower().endswith(".dxf")):
+            writeSheetSVG(fileName, sheets[0], outlines)
+        else:
+            writeSheetDXF(fileName, sheets[0], outlines)
+
+        message = "{:d} sprockets placed, {:.1f}% of the sheet used.".format(len(sheets[0].parts), 100*sheets[0].utilisation)
+        if rejected:
+            message += "\n{:d} did not fit.".format(len(rejected))
+        QMessageBox.information(self, "Export sheet", message)
+
+    def millingOptions(self):
+        # None (after telling the user) when a field does not hold a positive number
+        try:
+            options = MillingOptions(
+                tool_dia = float(self.cutterDiameter.text()),
+                depth = float(self.stockThickness.text()),
+                step_down = float(self.passDepth.text()),
+                feed = float(self.feedRate.text()),
+                drills = self.cutterLeftovers.isChecked())
+        except ValueError:
+            options = None
+        if options is None or min(options.tool_dia, options.depth, options.step_down, options.feed) <= 0:
+            QMessageBox.warning(self, "Extra Options", "Cutter diameter, stock thickness, pass depth and feed rate must be positive numbers.")
+            return None
+        return options
+
+    def onSolve(self):
+        self.solverResults.clear()
+        try:
+            results = solveDesigns(
+                tooth_dia = float(self.toothDiameter.text()),
+                tooth_pitch = float(self.toothSpacing.text()),
+                flank_height = float(self.toothFlankHeight.text()),
+                min_outer_diameter = float(self.solverMinOuter.text()),
+                max_outer_diameter = float(self.solverMaxOuter.text()),
+                teeth = (1, MAX_TEETH))
+        except ValueError:
+            return
+
+        if not results:
+            self.solverResults.addItem("No design fits")
+            return
+
+        for r in results:
+            item = QListWidgetItem("{:d} teeth, {:.0f}% -> {:.3f} mm".format(r.params.n_teeth,
+                r.params.tooth_length_pct, r.outer_diameter))
+            item.setData(Qt.ItemDataRole.UserRole, r.params)
+            self.solverResults.addItem(item)
+
+    def onSolverResultClicked(self, item):
+        params = item.data(Qt.ItemDataRole.UserRole)
+        if params is None:
+            return
+        self.numTeeth.setText(str(params.n_teeth))
+        self.toothLengthPct.setText("{:g}".format(params.tooth_length_pct))
+        self.computeGear()
 
     def onInnerEnter(self):
         if (self.inner_radius > 0):
@@ -387,7 +590,3 @@ def main():
     app = QApplication(sys.argv)
     window = MainWindow()
     sys.exit(app.exec())
-
-if (__name__ == "__main__"):
-    main()
-
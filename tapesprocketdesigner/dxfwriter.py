@@ -0,0 +1,645 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Minimal streaming DXF R2000 (AC1015) writer.
+#
+# Entities are formatted straight from the geometry arrays and written to the
+# output stream in chunks, there is no document or entity graph in memory.
+# The file contains the smallest set of tables, blocks and objects that
+# ezdxf and common CAD/CAM tools expect from an R2000 file; all entities
+# go to model space on layer 0.
+#
+#   with open("sprocket.dxf", "w") as f:
+#       dxf = DXFWriter(f)
+#       dxf.addLines(segments)
+#       dxf.close()
+
+import numpy as np
+
+# $INSUNITS values
+UNITS_UNITLESS = 0
+UNITS_INCH = 1
+UNITS_MM = 4
+
+# number of entities formatted per write() call
+CHUNK_SIZE = 4096
+
+# handles of the fixed document skeleton, entities are numbered from FIRST_HANDLE
+MODEL_SPACE_RECORD = "12"
+FIRST_HANDLE = 0x100
+
+HEADER = """\
+  0
+SECTION
+  2
+HEADER
+  9
+$ACADVER
+  1
+AC1015
+  9
+$HANDSEED
+  5
+{handseed:X}
+  9
+$INSUNITS
+ 70
+{units:d}
+  9
+$MEASUREMENT
+ 70
+{measurement:d}
+  0
+ENDSEC
+  0
+SECTION
+  2
+CLASSES
+  0
+ENDSEC
+  0
+SECTION
+  2
+TABLES
+  0
+TABLE
+  2
+VPORT
+  5
+1
+330
+0
+100
+AcDbSymbolTable
+ 70
+1
+  0
+VPORT
+  5
+2
+330
+1
+100
+AcDbSymbolTableRecord
+100
+AcDbViewportTableRecord
+  2
+*Active
+ 70
+0
+ 10
+0.0
+ 20
+0.0
+ 11
+1.0
+ 21
+1.0
+ 12
+0.0
+ 22
+0.0
+ 13
+0.0
+ 23
+0.0
+ 14
+1.0
+ 24
+1.0
+ 15
+1.0
+ 25
+1.0
+ 16
+0.0
+ 26
+0.0
+ 36
+1.0
+ 17
+0.0
+ 27
+0.0
+ 37
+0.0
+ 40
+1.0
+ 41
+1.0
+ 42
+50.0
+ 43
+0.0
+ 44
+0.0
+ 50
+0.0
+ 51
+0.0
+ 71
+0
+ 72
+100
+ 73
+1
+ 74
+3
+ 75
+0
+ 76
+0
+ 77
+0
+ 78
+0
+  0
+ENDTAB
+  0
+TABLE
+  2
+LTYPE
+  5
+3
+330
+0
+100
+AcDbSymbolTable
+ 70
+3
+  0
+LTYPE
+  5
+4
+330
+3
+100
+AcDbSymbolTableRecord
+100
+AcDbLinetypeTableRecord
+  2
+ByBlock
+ 70
+0
+  3
+
+ 72
+65
+ 73
+0
+ 40
+0.0
+  0
+LTYPE
+  5
+5
+330
+3
+100
+AcDbSymbolTableRecord
+100
+AcDbLinetypeTableRecord
+  2
+ByLayer
+ 70
+0
+  3
+
+ 72
+65
+ 73
+0
+ 40
+0.0
+  0
+LTYPE
+  5
+6
+330
+3
+100
+AcDbSymbolTableRecord
+100
+AcDbLinetypeTableRecord
+  2
+Continuous
+ 70
+0
+  3
+Solid line
+ 72
+65
+ 73
+0
+ 40
+0.0
+  0
+ENDTAB
+  0
+TABLE
+  2
+LAYER
+  5
+7
+330
+0
+100
+AcDbSymbolTable
+ 70
+1
+  0
+LAYER
+  5
+8
+330
+7
+100
+AcDbSymbolTableRecord
+100
+AcDbLayerTableRecord
+  2
+0
+ 70
+0
+ 62
+7
+  6
+Continuous
+370
+-3
+390
+0
+  0
+ENDTAB
+  0
+TABLE
+  2
+STYLE
+  5
+9
+330
+0
+100
+AcDbSymbolTable
+ 70
+1
+  0
+STYLE
+  5
+A
+330
+9
+100
+AcDbSymbolTableRecord
+100
+AcDbTextStyleTableRecord
+  2
+Standard
+ 70
+0
+ 40
+0.0
+ 41
+1.0
+ 50
+0.0
+ 71
+0
+ 42
+2.5
+  3
+txt
+  4
+
+  0
+ENDTAB
+  0
+TABLE
+  2
+VIEW
+  5
+B
+330
+0
+100
+AcDbSymbolTable
+ 70
+0
+  0
+ENDTAB
+  0
+TABLE
+  2
+UCS
+  5
+C
+330
+0
+100
+AcDbSymbolTable
+ 70
+0
+  0
+ENDTAB
+  0
+TABLE
+  2
+APPID
+  5
+D
+330
+0
+100
+AcDbSymbolTable
+ 70
+1
+  0
+APPID
+  5
+E
+330
+D
+100
+AcDbSymbolTableRecord
+100
+AcDbRegAppTableRecord
+  2
+ACAD
+ 70
+0
+  0
+ENDTAB
+  0
+TABLE
+  2
+DIMSTYLE
+  5
+F
+330
+0
+100
+AcDbSymbolTable
+ 70
+1
+100
+AcDbDimStyleTable
+  0
+DIMSTYLE
+105
+10
+330
+F
+100
+AcDbSymbolTableRecord
+100
+AcDbDimStyleTableRecord
+  2
+Standard
+ 70
+0
+  0
+ENDTAB
+  0
+TABLE
+  2
+BLOCK_RECORD
+  5
+11
+330
+0
+100
+AcDbSymbolTable
+ 70
+2
+  0
+BLOCK_RECORD
+  5
+12
+330
+11
+100
+AcDbSymbolTableRecord
+100
+AcDbBlockTableRecord
+  2
+*Model_Space
+  0
+BLOCK_RECORD
+  5
+13
+330
+11
+100
+AcDbSymbolTableRecord
+100
+AcDbBlockTableRecord
+  2
+*Paper_Space
+  0
+ENDTAB
+  0
+ENDSEC
+  0
+SECTION
+  2
+BLOCKS
+  0
+BLOCK
+  5
+14
+330
+12
+100
+AcDbEntity
+  8
+0
+100
+AcDbBlockBegin
+  2
+*Model_Space
+ 70
+0
+ 10
+0.0
+ 20
+0.0
+ 30
+0.0
+  3
+*Model_Space
+  1
+
+  0
+ENDBLK
+  5
+15
+330
+12
+100
+AcDbEntity
+  8
+0
+100
+AcDbBlockEnd
+  0
+BLOCK
+  5
+16
+330
+13
+100
+AcDbEntity
+ 67
+1
+  8
+0
+100
+AcDbBlockBegin
+  2
+*Paper_Space
+ 70
+0
+ 10
+0.0
+ 20
+0.0
+ 30
+0.0
+  3
+*Paper_Space
+  1
+
+  0
+ENDBLK
+  5
+17
+330
+13
+100
+AcDbEntity
+ 67
+1
+  8
+0
+100
+AcDbBlockEnd
+  0
+ENDSEC
+  0
+SECTION
+  2
+ENTITIES
+"""
+
+FOOTER = """\
+  0
+ENDSEC
+  0
+SECTION
+  2
+OBJECTS
+  0
+DICTIONARY
+  5
+18
+330
+0
+100
+AcDbDictionary
+281
+1
+  3
+ACAD_GROUP
+350
+19
+  0
+DICTIONARY
+  5
+19
+330
+18
+100
+AcDbDictionary
+281
+1
+  0
+ENDSEC
+  0
+EOF
+"""
+
+LINE = ("  0\nLINE\n  5\n%X\n330\n" + MODEL_SPACE_RECORD + "\n100\nAcDbEntity\n  8\n0\n100\nAcDbLine\n"
+    " 10\n%r\n 20\n%r\n 30\n0.0\n 11\n%r\n 21\n%r\n 31\n0.0\n")
+
+POINT = ("  0\nPOINT\n  5\n%X\n330\n" + MODEL_SPACE_RECORD + "\n100\nAcDbEntity\n  8\n0\n100\nAcDbPoint\n"
+    " 10\n%r\n 20\n%r\n 30\n0.0\n")
+
+LWPOLYLINE = ("  0\nLWPOLYLINE\n  5\n%X\n330\n" + MODEL_SPACE_RECORD + "\n100\nAcDbEntity\n  8\n0\n100\nAcDbPolyline\n"
+    " 90\n%d\n 70\n%d\n 43\n0.0\n")
+
+VERTEX = " 10\n%r\n 20\n%r\n"
+
+BULGE_VERTEX = " 10\n%r\n 20\n%r\n 42\n%r\n"
+
+ARC = ("  0\nARC\n  5\n%X\n330\n" + MODEL_SPACE_RECORD + "\n100\nAcDbEntity\n  8\n0\n100\nAcDbCircle\n"
+    " 10\n%r\n 20\n%r\n 30\n0.0\n 40\n%r\n100\nAcDbArc\n 50\n%r\n 51\n%r\n")
+
+class DXFWriter:
+
+    def __init__(self, stream, units : int = UNITS_MM, maxEntities : int = 0xFFFFF):
+        # 'maxEntities' only sizes $HANDSEED, which has to be written before
+        # the entities and must be larger than any handle in the file.
+        self.stream = stream
+        self.handle = FIRST_HANDLE
+        self.maxHandle = FIRST_HANDLE + maxEntities
+        self.stream.write(HEADER.format(handseed=self.maxHandle + 1, units=units,
+            measurement=0 if units == UNITS_INCH else 1))
+
+    def _nextHandles(self, count : int) -> range:
+        handles = range(self.handle, self.handle + count)
+        self.handle += count
+        if self.handle > self.maxHandle + 1:
+            raise ValueError("DXFWriter: more entities than maxEntities")
+        return handles
+
+    def addLines(self, segments):
+        # segments: (n,2,2) array of ((x1,y1),(x2,y2))
+        rows = np.asarray(segments, dtype=np.float64).reshape(-1, 4).tolist()
+        handles = self._nextHandles(len(rows))
+        for start in range(0, len(rows), CHUNK_SIZE):
+            self.stream.write("".join([LINE % (h, x1, y1, x2, y2)
+                for h, (x1, y1, x2, y2) in zip(handles[start:start+CHUNK_SIZE], rows[start:start+CHUNK_SIZE])]))
+
+    def addPoints(self, points):
+        # points: (n,2) array, e.g. drill hits
+        rows = np.asarray(points, dtype=np.float64).reshape(-1, 2).tolist()
+        handles = self._nextHandles(len(rows))
+        for start in range(0, len(rows), CHUNK_SIZE):
+            self.stream.write("".join([POINT % (h, x, y)
+                for h, (x, y) in zip(handles[start:start+CHUNK_SIZE], rows[start:start+CHUNK_SIZE])]))
+
+    def addArcs(self, centers, radii, startAngles, endAngles):
+        # counterclockwise arcs, centers (n,2), angles in degrees
+        rows = np.column_stack((np.asarray(centers, dtype=np.float64).reshape(-1, 2),
+            radii, startAngles, endAngles)).tolist()
+        handles = self._nextHandles(len(rows))
+        for start in range(0, len(rows), CHUNK_SIZE):
+            self.stream.write("".join([ARC % (h, cx, cy, r, a0, a1)
+                for h, (cx, cy, r, a0, a1) in zip(handles[start:start+CHUNK_SIZE], rows[start:start+CHUNK_SIZE])]))
+
+    def addPolyline(self, vertices, closed : bool = True, bulges = None):
+        # vertices: (n,2) array, written as a single LWPOLYLINE.
+        # bulges: optional (n,) array, bulge of the edge starting at each vertex
+        rows = np.asarray(vertices, dtype=np.float64).reshape(-1, 2).tolist()
+        handle, = self._nextHandles(1)
+        self.stream.write(LWPOLYLINE % (handle, len(rows), 1 if closed else 0))
+        if bulges is None:
+            bulges = [0.0] * len(rows)
+        else:
+            bulges = np.asarray(bulges, dtype=np.float64).tolist()
+        for start in range(0, len(rows), CHUNK_SIZE):
+            self.stream.write("".join([(BULGE_VERTEX % (x, y, b)) if b else (VERTEX % (x, y))
+                for (x, y), b in zip(rows[start:start+CHUNK_SIZE], bulges[start:start+CHUNK_SIZE])]))
+
+    def close(self):
+        self.stream.write(FOOTER)
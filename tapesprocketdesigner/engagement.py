@@ -0,0 +1,95 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Tape engagement checker.
+#
+# The tape rests on the inner radius and its top is at the design radius.
+# Where it is wrapped around the sprocket, the tooth flanks match the hole
+# edges by construction. Where the tape leaves the sprocket it runs along the
+# tangent at the point it leaves, and the teeth cross it at an angle: this is
+# the case the tooth taper has to clear.
+#
+# In the tape frame the tangent point is at polar angle 0 and the tape is a
+# straight band between the tangent lines at the inner and the design radius,
+# with holes of the tooth width centered at the unwrapped arc length of each
+# tooth center (measured at the design radius, where the pitch is defined).
+# All teeth are the same, so sweeping the rotation over one pitch covers every
+# position: for each rotation step, every tooth position past the tangent
+# point is clipped to the band and its extent along the tape is compared with
+# the hole edges, all in one batch of array operations.
+#
+# Clearance is the smallest distance between a tooth and a hole edge inside
+# the tape; a negative clearance means the tooth cuts into the tape.
+
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from .geometry import VERTICES_PER_TOOTH
+
+# clearances above -CONTACT_TOLERANCE count as touching, not colliding
+CONTACT_TOLERANCE = 1e-9
+
+class EngagementReport(NamedTuple):
+    min_clearance : float           # over all rotations and tooth positions
+    worst_angle : float             # degrees past the tangent point of the tooth with the minimum
+    colliding_positions : tuple     # tooth positions that cut into the tape, 0 = first tooth past the tangent point
+    rotations : np.ndarray          # (M,) rotation steps, degrees within one pitch
+    clearance : np.ndarray          # (M,) smallest clearance at each rotation step
+
+def checkEngagement(sprocket, steps : int = 360) -> EngagementReport:
+    params = sprocket.params
+    n_teeth = int(params.n_teeth)
+    hole_width = params.tooth_dia
+    r_inner = sprocket.inner_radius
+    r_design = sprocket.design_radius
+    pitch_angle = 2*math.pi / n_teeth
+
+    # corner vertices of the first tooth (centered at angle 0): inner right, design right,
+    # outer right, outer left, design left, inner left. Closed by the base chord, the polygon is convex.
+    tooth = sprocket.outline.vertices[:VERTICES_PER_TOOTH]
+
+    # (M,J) angle of each tooth position past the tangent point; teeth more than a
+    # quarter turn past it point away from the tape, teeth behind it sit in the
+    # wrapped part of the tape, where the flanks match the holes by construction
+    positions = int(math.ceil((math.pi / 2) / pitch_angle))
+    rotation = np.linspace(0.0, pitch_angle, steps, endpoint=False)
+    past = (np.arange(positions)[np.newaxis, :] * pitch_angle) + rotation[:, np.newaxis]
+
+    # (M,J,6) tape frame: d is the distance from the center across the tape,
+    # s the position along the tape measured from the tangent point
+    cos_p = np.cos(past)[..., np.newaxis]
+    sin_p = np.sin(past)[..., np.newaxis]
+    d = tooth[:, 0]*cos_p - tooth[:, 1]*sin_p
+    s = tooth[:, 0]*sin_p + tooth[:, 1]*cos_p
+
+    # candidate extreme points of the clipped polygon: vertices inside the band ...
+    inside = (d >= r_inner) & (d <= r_design)
+    candidates = [np.where(inside, s, np.nan)]
+
+    # ... and the crossings of every edge with both band edges
+    d1 = np.roll(d, -1, axis=-1)
+    s1 = np.roll(s, -1, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for level in (r_inner, r_design):
+            t = (level - d) / (d1 - d)
+            crossing = (t >= 0) & (t <= 1)
+            candidates.append(np.where(crossing, s + t*(s1 - s), np.nan))
+
+    candidates = np.concatenate(candidates, axis=-1)
+    engaged = ~np.isnan(candidates).all(axis=-1)
+    candidates[~engaged] = 0.0
+    s_min = np.nanmin(candidates, axis=-1)
+    s_max = np.nanmax(candidates, axis=-1)
+
+    hole_center = r_design * past
+    clearance = np.minimum(s_min - (hole_center - hole_width/2), (hole_center + hole_width/2) - s_max)
+    clearance = np.where(engaged, clearance, np.inf)
+
+    per_rotation = clearance.min(axis=1)
+    worst = np.unravel_index(np.argmin(clearance), clearance.shape)
+    colliding = np.flatnonzero((clearance < -CONTACT_TOLERANCE).any(axis=0))
+
+    return EngagementReport(float(clearance[worst]), float(np.degrees(past[worst])),
+        tuple(colliding.tolist()), np.degrees(rotation), per_rotation)
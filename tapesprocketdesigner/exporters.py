@@ -0,0 +1,170 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# DXF, SVG, G-code and STL/3MF writers, shared by the GUI and the batch generator.
+# ezdxf is slow to import, so it is only loaded when the ezdxf
+# reference writer is actually used.
+
+import os
+
+import numpy as np
+
+from .outline import Outline, UNIT_CONVERSIONS, bulgeArcs
+from .dxfwriter import DXFWriter, UNITS_MM, UNITS_INCH
+from .gcodewriter import GCodeWriter, UNITS_MM as GCODE_MM, UNITS_INCH as GCODE_INCH
+from .toolpath import MillingOptions
+from .mesh import extrudeOutline
+from .meshwriter import writeSTLMesh, write3MFMesh
+from .svgwriter import formatNumbers, pathData, writeSVGDocument
+from .profiling import span, timedStream
+
+def edgeArcs(outline : Outline):
+    # split the edges of an outline into straight segments (n,2,2) and
+    # counterclockwise arcs (centers, radii, start and end angles in degrees)
+    segments = outline.segments()
+    if not outline.hasArcs():
+        return segments, (np.zeros((0, 2)), np.zeros(0), np.zeros(0), np.zeros(0))
+
+    is_arc = outline.bulges != 0
+    center, radius, start, sweep = bulgeArcs(outline.vertices, outline.bulges)
+
+    # clockwise arcs are written from their end point
+    start = np.where(sweep < 0, start + sweep, start)
+    a0 = np.degrees(start[is_arc]) % 360.0
+    a1 = (a0 + np.degrees(np.abs(sweep[is_arc]))) % 360.0
+    return segments[~is_arc], (center[is_arc], radius[is_arc], a0, a1)
+
+def writeDXF(file, outline : Outline, polyline : bool = False, conversion : str = "none"):
+    # Streaming writer. 'file' is a file name or a writable text stream.
+    # The outline is written as LINE and ARC entities or as a single closed
+    # LWPOLYLINE, and its extra points (drill hits) as POINT entities.
+    # 'conversion' is one of the UNIT_CONVERSIONS keys.
+    if isinstance(file, (str, os.PathLike)):
+        with span("export.dxf"), open(file, "w") as f:
+            return writeDXF(timedStream(f, "write.dxf"), outline, polyline, conversion)
+
+    outline = outline.converted(conversion)
+    entities = (1 if polyline else len(outline)) + len(outline.points)
+    dxf = DXFWriter(file, UNITS_INCH if conversion == "mm to inches" else UNITS_MM, maxEntities=entities)
+    if polyline:
+        dxf.addPolyline(outline.vertices, closed=True, bulges=outline.bulges)
+    else:
+        lines, arcs = edgeArcs(outline)
+        dxf.addLines(lines)
+        dxf.addArcs(*arcs)
+    dxf.addPoints(outline.points)
+    dxf.close()
+
+def writeDXFEzdxf(fileName : str, outline : Outline):
+    # Reference implementation on top of ezdxf, builds the whole document in memory.
+    with span("export.dxf_ezdxf"):
+        return buildDXFEzdxf(outline).saveas(fileName)
+
+def buildDXFEzdxf(outline : Outline):
+    import ezdxf
+    from ezdxf import units
+
+    doc = ezdxf.new("R2000")
+    doc.units = units.MM
+    msp = doc.modelspace()
+
+    lines, arcs = edgeArcs(outline)
+    for pstart, pstop in lines.tolist():
+        msp.add_line(pstart, pstop)
+    for center, radius, a0, a1 in zip(*(np.asarray(v).tolist() for v in arcs)):
+        msp.add_arc(center, radius, a0, a1)
+    for point in outline.points.tolist():
+        msp.add_point(point)
+    return doc
+
+def writeSVG(file, outline : Outline, max_outer_radius : float, precision : int = 3):
+    # 'file' is a file name or a writable text stream. The outline is written
+    # as a single closed path, centered on a square page of max. outer diameter.
+    if isinstance(file, (str, os.PathLike)):
+        with span("export.svg"), open(file, "w", encoding="utf-8") as f:
+            return writeSVG(timedStream(f, "write.svg"), outline, max_outer_radius, precision)
+
+    w = max_outer_radius * 2
+    h = max_outer_radius * 2
+    size = formatNumbers((w, h), max(precision, 3))
+    d = pathData(outline.vertices + (w/2, h/2), precision, bulges=outline.bulges)
+    writeSVGDocument(file, size[0], size[1], [d])
+
+def writeGCode(file, toolpath : Outline, options : MillingOptions, conversion : str = "none"):
+    # 'file' is a file name or a writable text stream. 'toolpath' is the cutter
+    # center path (see toolpath.computeToolpath) with the drill hits as its points.
+    # All lengths and feeds are converted along with the toolpath.
+    if isinstance(file, (str, os.PathLike)):
+        with span("export.gcode"), open(file, "w") as f:
+            return writeGCode(timedStream(f, "write.gcode"), toolpath, options, conversion)
+
+    factor = UNIT_CONVERSIONS[conversion]
+    toolpath = toolpath.converted(conversion)
+    gcode = GCodeWriter(file, GCODE_INCH if conversion == "mm to inches" else GCODE_MM,
+        options.safe_z*factor, options.feed*factor, options.plunge_feed*factor)
+    gcode.addProfile(toolpath, options.depth*factor, options.step_down*factor)
+    gcode.addDrills(toolpath.points, options.depth*factor)
+    gcode.close()
+
+def writeSTL(file, outline : Outline, thickness : float, bore_dia : float = 0.0, tolerance : float = 0.01):
+    # Binary STL of the outline extruded to 'thickness', with an optional bore.
+    # 'file' is a file name or a writable binary stream. The mesh is built before
+    # the file is opened, so a ValueError from extrudeOutline leaves no file behind.
+    with span("export.stl"):
+        mesh = extrudeOutline(outline, thickness, bore_dia, tolerance)
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "wb") as f:
+                return writeSTLMesh(timedStream(f, "write.stl"), *mesh)
+        writeSTLMesh(file, *mesh)
+
+def write3MF(file, outline : Outline, thickness : float, bore_dia : float = 0.0, tolerance : float = 0.01):
+    # Same mesh as writeSTL, as a 3MF package. 'file' is a file name or a writable binary stream.
+    with span("export.3mf"):
+        mesh = extrudeOutline(outline, thickness, bore_dia, tolerance)
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "wb") as f:
+                return write3MFMesh(timedStream(f, "write.3mf"), *mesh)
+        write3MFMesh(file, *mesh)
+
+def writeSheetDXF(file, sheet, outlines):
+    # All parts of a NestedSheet (see nesting.py) in one DXF, 'outlines' being
+    # the list that was nested. 'file' is a file name or a writable text stream.
+    if isinstance(file, (str, os.PathLike)):
+        with span("export.sheet_dxf"), open(file, "w") as f:
+            return writeSheetDXF(timedStream(f, "write.sheet_dxf"), sheet, outlines)
+
+    # the edges of every design are split once, then moved to every place it goes
+    edges = {}
+    lines, centers, radii, a0, a1, points = [], [], [], [], [], []
+    for part, offset in zip(sheet.parts.tolist(), sheet.centers):
+        outline = outlines[part]
+        if id(outline) not in edges:
+            edges[id(outline)] = edgeArcs(outline)
+        part_lines, (arc_centers, arc_radii, arc_a0, arc_a1) = edges[id(outline)]
+        lines.append(part_lines + offset)
+        centers.append(arc_centers + offset)
+        radii.append(arc_radii)
+        a0.append(arc_a0)
+        a1.append(arc_a1)
+        points.append(outline.points + offset)
+
+    lines = np.concatenate(lines) if lines else np.zeros((0, 2, 2))
+    arcs = [np.concatenate(v) if v else np.zeros((0, 2) if k == 0 else 0) for k, v in enumerate((centers, radii, a0, a1))]
+    points = np.concatenate(points) if points else np.zeros((0, 2))
+
+    dxf = DXFWriter(file, maxEntities=len(lines) + len(arcs[1]) + len(points))
+    dxf.addLines(lines)
+    dxf.addArcs(*arcs)
+    dxf.addPoints(points)
+    dxf.close()
+
+def writeSheetSVG(file, sheet, outlines, precision : int = 3):
+    # All parts of a NestedSheet as one SVG page of the sheet size, one closed path per part.
+    if isinstance(file, (str, os.PathLike)):
+        with span("export.sheet_svg"), open(file, "w", encoding="utf-8") as f:
+            return writeSheetSVG(timedStream(f, "write.sheet_svg"), sheet, outlines, precision)
+
+    size = formatNumbers((sheet.width, sheet.height), max(precision, 3))
+    paths = [pathData(outlines[part].vertices + offset, precision, bulges=outlines[part].bulges)
+        for part, offset in zip(sheet.parts.tolist(), sheet.centers)]
+    writeSVGDocument(file, size[0], size[1], paths)
@@ -0,0 +1,94 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Minimal streaming G-code writer for 2.5D profiles and drill hits.
+#
+# Moves are formatted straight from the toolpath arrays and written to the
+# output stream in chunks. Only the common subset of G-code is used (G0/G1,
+# G2/G3 with I/J centers, no canned cycles), so the output runs on GRBL as
+# well as on LinuxCNC style controllers. Z=0 is the top of the stock.
+#
+#   with open("sprocket.nc", "w") as f:
+#       gcode = GCodeWriter(f)
+#       gcode.addProfile(toolpath, depth=3.0, stepDown=1.0)
+#       gcode.addDrills(toolpath.points, depth=3.0)
+#       gcode.close()
+
+import math
+
+import numpy as np
+
+from .outline import bulgeArcs
+
+# unit selection codes
+UNITS_MM = "G21"
+UNITS_INCH = "G20"
+
+# number of moves formatted per write() call
+CHUNK_SIZE = 4096
+
+HEADER = """\
+(tapesprocketdesigner toolpath)
+{units:s} G90 G17 G94
+G0 Z{safe_z:.4f}
+"""
+
+FOOTER = """\
+G0 Z{safe_z:.4f}
+M2
+"""
+
+LINEAR = "G1 X%.4f Y%.4f\n"
+ARC = "%s X%.4f Y%.4f I%.4f J%.4f\n"
+DRILL = "G0 X%.4f Y%.4f\nG0 Z%.4f\nG1 Z%.4f F%.1f\nG0 Z%.4f\n"
+
+class GCodeWriter:
+
+    def __init__(self, stream, units : str = UNITS_MM, safeZ : float = 5.0, feed : float = 300.0,
+        plungeFeed : float = 100.0):
+        self.stream = stream
+        self.safeZ = safeZ
+        self.feed = feed
+        self.plungeFeed = plungeFeed
+        self.stream.write(HEADER.format(units=units, safe_z=safeZ))
+
+    def addProfile(self, outline, depth : float, stepDown : float):
+        # Cut the closed outline (the cutter center path) in passes of at most
+        # 'stepDown' until 'depth' below the stock surface is reached.
+        vertices = outline.vertices
+        if len(vertices) == 0:
+            return
+        passes = max(1, int(math.ceil(depth / stepDown - 1e-9)))
+
+        # the moves of one lap, from vertex 0 around and back to vertex 0
+        ends = np.roll(vertices, -1, axis=0)
+        if outline.hasArcs():
+            center, _, _, sweep = bulgeArcs(vertices, outline.bulges)
+            ij = center - vertices
+            codes = np.where(sweep < 0, "G2", "G3")
+            is_arc = (outline.bulges != 0).tolist()
+            rows = zip(is_arc, codes.tolist(), ends.tolist(), ij.tolist())
+            moves = [(ARC % (code, x, y, i, j)) if arc else (LINEAR % (x, y))
+                for arc, code, (x, y), (i, j) in rows]
+        else:
+            moves = [LINEAR % (x, y) for x, y in ends.tolist()]
+        lap = "".join(moves)
+
+        x0, y0 = vertices[0].tolist()
+        self.stream.write("G0 X%.4f Y%.4f\nG0 Z%.4f\n" % (x0, y0, min(self.safeZ, 1.0)))
+        for k in range(1, passes + 1):
+            z = -min(depth, k*stepDown)
+            self.stream.write("G1 Z%.4f F%.1f\nF%.1f\n" % (z, self.plungeFeed, self.feed))
+            self.stream.write(lap)
+        self.stream.write("G0 Z%.4f\n" % self.safeZ)
+
+    def addDrills(self, points, depth : float):
+        # plunge at every point (n,2), retracting to the safe height in between
+        rows = np.asarray(points, dtype=np.float64).reshape(-1, 2).tolist()
+        approach = min(self.safeZ, 1.0)
+        for start in range(0, len(rows), CHUNK_SIZE):
+            self.stream.write("".join([DRILL % (x, y, approach, -depth, self.plungeFeed, self.safeZ)
+                for x, y in rows[start:start+CHUNK_SIZE]]))
+
+    def close(self):
+        self.stream.write(FOOTER.format(safe_z=self.safeZ))
@@ -0,0 +1,219 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Headless sprocket geometry engine.
+#
+# Everything here works on NumPy arrays so that a single design, or a whole
+# batch of designs, is computed in one vectorized pass. Nothing in this module
+# depends on Qt, so it can be used from scripts and worker processes.
+
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from .outline import Outline
+
+# number of outline vertices generated for each tooth:
+# right flank start, right face start, right tip, left tip, left face end, left flank end
+VERTICES_PER_TOOTH = 6
+
+class SprocketParameters(NamedTuple):
+    n_teeth : int = 14
+    tooth_dia : float = 1.0
+    tooth_pitch : float = 4.0
+    flank_height : float = 1.0
+    tooth_length_pct : float = 60.0
+
+class SprocketRadii(NamedTuple):
+    design_radius : np.ndarray
+    inner_radius : np.ndarray
+    outer_radius : np.ndarray
+    max_outer_radius : np.ndarray
+    chord_angle : np.ndarray            # degrees, angle subtended by one tooth at the design radius
+    tooth_ending_angle : np.ndarray     # degrees, half angle of the blunted tip
+
+class Sprocket:
+
+    def __init__(self, params : SprocketParameters, radii : SprocketRadii, vertices : np.ndarray,
+        bulges : np.ndarray = None):
+        self.params = params
+        self.design_radius = float(radii.design_radius)
+        self.inner_radius = float(radii.inner_radius)
+        self.outer_radius = float(radii.outer_radius)
+        self.max_outer_radius = float(radii.max_outer_radius)
+        self.chord_angle = float(radii.chord_angle)
+        self.tooth_ending_angle = float(radii.tooth_ending_angle)
+
+        # closed ring of n_teeth*VERTICES_PER_TOOTH vertices, with a DXF style bulge
+        # for the edge from each vertex to the next one: 0 for a straight edge,
+        # tan(sweep/4) for an arc (positive is counterclockwise)
+        if bulges is None:
+            bulges = computeBulges(params.n_teeth, radii)
+        self.outline = Outline(vertices, bulges)
+
+    def radii(self) -> SprocketRadii:
+        return SprocketRadii(self.design_radius, self.inner_radius, self.outer_radius, self.max_outer_radius,
+            self.chord_angle, self.tooth_ending_angle)
+
+    def isValid(self) -> bool:
+        # False for physically impossible parameters, see validDesigns()
+        return bool(validDesigns(self.params, self.radii())) and bool(np.isfinite(self.outline.vertices).all())
+
+def polarToRect(r, theta):
+    # theta in degrees, works on scalars and arrays
+    theta = np.radians(theta)
+    return np.stack((r*np.cos(theta), r*np.sin(theta)), axis=-1)
+
+def computeRadii(n_teeth, tooth_dia, tooth_pitch, flank_height, tooth_length_pct) -> SprocketRadii:
+    # All arguments may be scalars or (broadcastable) arrays.
+    #
+    # Process:
+    # Generate a single tooth: taper edges so that (leftedge-to-rightedge) distance is no greater than the outer-to-outer distance at the base of the tooth: 'undo' the splay caused by the teeth being on an arc.
+    # This splay is given by the angle that subtends the arc bounded by the outer edges of the tooth (straight part at top of "design" radius). This is the center-to-center arc length + the arc 'inside' one tooth (1/2 tooth on the outside of each center).
+    # But we already know the *angle* formed by the center-to-center tooth pitch: (360/nTeeth), so we only need to find the arc length inside one tooth and its resulting angle, and add this to the pitch angle.
+    # So the outer (as well as inner) surface of each tooth must come in 1/2 that amount (relative to radial / sticking straight out).
+    n_teeth = np.asarray(n_teeth, dtype=np.float64)
+    tooth_dia = np.asarray(tooth_dia, dtype=np.float64)
+    tooth_pitch = np.asarray(tooth_pitch, dtype=np.float64)
+    flank_height = np.asarray(flank_height, dtype=np.float64)
+    tooth_length_pct = np.asarray(tooth_length_pct, dtype=np.float64)
+
+    # Design radius: ((nTeeth*pitch) / (2*pi))
+    # Inner radius: design radius - flank height
+    design_radius = (n_teeth * tooth_pitch) / (2.0*math.pi)
+    inner_radius = design_radius - flank_height
+
+    # Intratooth arc angle in degrees: (360/pi) * asin(C / 2r), where C = chord length.
+    # teeth wider than the design diameter, or no teeth at all, give NaN or inf here,
+    # see validDesigns()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        chord_angle = np.degrees(2.0 * np.arcsin(tooth_dia / (2.0 * design_radius)))
+
+        ####FIXME: Tooth auto-angle currently broken. Making two adjacent teeth 'straight' on their outside edges is not enough!
+        tooth_outer_angle = (chord_angle + (360.0 / n_teeth)) / 4.0 # half the equidistant-to-two-teeth to edge-of-tooth angle -> 1/4 of edge-to-edge angle
+    tooth_inner_angle = 90.0 - tooth_outer_angle - (chord_angle / 2.0)
+
+    # Tooth face height: tan(90-angle) = h / (w/2) --> h = (w/2)*tan(90-angle)
+    tooth_face_height = (tooth_dia / 2.0) * np.tan(np.radians(tooth_inner_angle))
+    max_outer_radius = design_radius + tooth_face_height
+    outer_radius = design_radius + (tooth_face_height * (tooth_length_pct/100.0))
+
+    # Where the face meets the outer radius, as an angle relative to the tooth center.
+    # When outer = max outer, the tooth comes to a point and the angle is 0.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        face_ratio = (outer_radius - design_radius) / (max_outer_radius - design_radius)
+    tooth_ending_angle = (1 - face_ratio) * (chord_angle / 2)
+
+    return SprocketRadii(design_radius, inner_radius, outer_radius, max_outer_radius,
+        chord_angle, tooth_ending_angle)
+
+def validDesigns(params, radii : SprocketRadii) -> np.ndarray:
+    # Vectorized validity test, the one behind Sprocket.isValid. 'params' holds the
+    # five SprocketParameters fields as scalars or (broadcastable) arrays, 'radii'
+    # the matching computeRadii result. A design is impossible when
+    #   - a parameter is out of range: no teeth, a tooth width, pitch or flank
+    #     height that is not positive, or a tooth length outside 0..100%
+    #   - the teeth are wider than the pitch allows, so neighbours overlap
+    #   - the flanks reach past the center, or the teeth point inwards
+    #   - any radius or angle is not finite
+    n_teeth, tooth_dia, tooth_pitch, flank_height, tooth_length_pct = (np.asarray(v, dtype=np.float64)
+        for v in params)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valid = (n_teeth >= 1) & (tooth_dia > 0) & (tooth_pitch > 0) & (flank_height > 0) & \
+            (tooth_length_pct >= 0) & (tooth_length_pct <= 100) & \
+            (radii.chord_angle < 360.0 / n_teeth) & (radii.inner_radius > 0) & \
+            (radii.max_outer_radius > radii.design_radius)
+    for v in radii:
+        valid = valid & np.isfinite(v)
+    return valid
+
+def computeOutline(n_teeth : int, radii : SprocketRadii) -> np.ndarray:
+    # Generate the closed outline for designs that share the same number of teeth.
+    # The radii may be scalars (one design) or 1-D arrays of length N (N designs),
+    # the result is (n_teeth*6, 2) or (N, n_teeth*6, 2) respectively.
+    #
+    # Polar angles are increasing counterclockwise, with zero "to the right".
+    # For each tooth, going from the righthand side to the lefthand side:
+    #   right flank, right face, blunted tip, left face, left flank
+    # and the segment from the last vertex to the first vertex of the next tooth
+    # is the space between the teeth.
+
+    n_teeth = int(n_teeth)
+    if n_teeth < 1:
+        # no teeth, no outline; such a design is not valid
+        return np.zeros(np.shape(radii.design_radius) + (0, 2))
+    radii = SprocketRadii(*(np.asarray(v, dtype=np.float64)[..., np.newaxis, np.newaxis] for v in radii))
+
+    tooth_centers = (360.0 / n_teeth) * np.arange(n_teeth, dtype=np.float64)[:, np.newaxis]
+
+    half_chord = radii.chord_angle / 2
+    tip = radii.tooth_ending_angle
+
+    # (..., 1, 6) radius and angle offset of every vertex relative to the tooth center
+    r = np.concatenate((radii.inner_radius, radii.design_radius, radii.outer_radius,
+        radii.outer_radius, radii.design_radius, radii.inner_radius), axis=-1)
+    offset = np.concatenate((-half_chord, -half_chord, -tip, tip, half_chord, half_chord), axis=-1)
+
+    theta = tooth_centers + offset      # (..., n_teeth, 6)
+    r = np.broadcast_to(r, theta.shape)
+
+    xy = polarToRect(r, theta)
+    return xy.reshape(xy.shape[:-3] + (n_teeth*VERTICES_PER_TOOTH, 2))
+
+def computeBulges(n_teeth : int, radii : SprocketRadii) -> np.ndarray:
+    # The blunted tip (edge 2 of every tooth) is an arc at the outer radius and the
+    # space between the teeth (edge 5) an arc at the inner radius, both counterclockwise
+    # around the sprocket center. Shapes follow computeOutline().
+    n_teeth = int(n_teeth)
+    if n_teeth < 1:
+        return np.zeros(np.shape(radii.design_radius) + (0,))
+    radii = SprocketRadii(*(np.asarray(v, dtype=np.float64)[..., np.newaxis] for v in radii))
+    zero = np.zeros_like(radii.chord_angle)
+
+    tip_sweep = 2 * radii.tooth_ending_angle
+    gap_sweep = (360.0 / n_teeth) - radii.chord_angle
+    bulges = np.concatenate((zero, zero, np.tan(np.radians(tip_sweep) / 4), zero, zero,
+        np.tan(np.radians(gap_sweep) / 4)), axis=-1)
+
+    return np.tile(bulges, n_teeth)
+
+def computeSprocket(params : SprocketParameters) -> Sprocket:
+    params = SprocketParameters(*params)
+    radii = computeRadii(*params)
+    return Sprocket(params, radii, computeOutline(params.n_teeth, radii))
+
+def computeSprocketArrays(params):
+    # Array-level batch computation, for sweeps that do not need a Sprocket
+    # object per design. 'params' is a sequence of SprocketParameters
+    # (or anything convertible to an (N,5) float array in the same field order).
+    # Returns the (N,5) parameter table, the radii as length-N arrays, and a
+    # dict mapping each distinct number of teeth to
+    # (row indices, outlines, bulges) where outlines has shape (len(indices), n_teeth*6, 2)
+    # and bulges (len(indices), n_teeth*6).
+    table = np.asarray(params, dtype=np.float64).reshape(-1, len(SprocketParameters._fields))
+    n_teeth = table[:,0].astype(np.int64)
+    radii = computeRadii(n_teeth, table[:,1], table[:,2], table[:,3], table[:,4])
+
+    outlines = {}
+    for n in np.unique(n_teeth):
+        idx = np.flatnonzero(n_teeth == n)
+        group_radii = SprocketRadii(*(v[idx] for v in radii))
+        outlines[int(n)] = (idx, computeOutline(n, group_radii), computeBulges(n, group_radii))
+
+    return table, radii, outlines
+
+def computeSprockets(params) -> list:
+    # Compute a batch of designs, returning one Sprocket per parameter row.
+    # Radii are computed for the whole batch at once, outlines once per
+    # distinct number of teeth.
+    table, radii, outlines = computeSprocketArrays(params)
+    rows = table[:,1:].tolist()
+    radii_rows = np.stack(radii, axis=-1).tolist()
+
+    result = [None] * len(table)
+    for n, (idx, group, bulges) in outlines.items():
+        for k, i in enumerate(idx.tolist()):
+            result[i] = Sprocket(SprocketParameters(n, *rows[i]), SprocketRadii(*radii_rows[i]), group[k], bulges[k])
+
+    return result
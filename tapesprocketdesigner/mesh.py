@@ -0,0 +1,83 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Extrusion of a closed outline into a closed triangle mesh, e.g. for 3D printing.
+#
+# The sprocket outline is star-shaped around its center: every ray from the
+# center crosses it once. That makes the caps easy to triangulate in linear
+# time: a fan from the center, or, with a bore, a ring of quads between the
+# outline and the bore circle sampled at the same polar angles. The side walls
+# are one quad per edge. All triangles are generated as index arrays in one
+# vectorized pass; the mesh is watertight and consistently oriented
+# (counterclockwise seen from outside). Radial edges, such as the tooth flanks,
+# give zero area cap triangles that keep the mesh closed.
+
+import math
+
+import numpy as np
+
+from .outline import Outline
+
+def extrudeOutline(outline : Outline, thickness : float, bore_dia : float = 0.0,
+    tolerance : float = 0.01) -> tuple:
+    # Returns (vertices (V,3) float64, triangles (T,3) int64). The outline lies
+    # in the z=0 plane and is extruded to z=thickness; arcs are tessellated
+    # within 'tolerance'. 'bore_dia' > 0 adds a round hole at the origin.
+    if thickness <= 0:
+        raise ValueError("extrudeOutline: thickness must be positive")
+
+    ring = outline.tessellate(tolerance).vertices
+    n = len(ring)
+    radius = np.hypot(ring[:, 0], ring[:, 1])
+    angle = np.unwrap(np.arctan2(ring[:, 1], ring[:, 0]))
+    step = np.diff(angle, append=angle[0] + 2*math.pi)
+    if (step < -1e-9).any() or abs(angle[-1] + step[-1] - angle[0] - 2*math.pi) > 1e-6:
+        raise ValueError("extrudeOutline: the outline is not star-shaped around the origin")
+    if bore_dia/2 >= radius.min():
+        raise ValueError("extrudeOutline: the bore is larger than the outline")
+
+    # vertices: outline at the bottom and the top, then the bore circle (at the
+    # outline's polar angles) or the center point at the bottom and the top
+    i = np.arange(n)
+    j = np.roll(i, -1)
+    bottom, top = i, i + n
+    if bore_dia > 0:
+        bore = (bore_dia / 2) * np.stack((np.cos(angle), np.sin(angle)), axis=-1)
+        xy = np.concatenate((ring, ring, bore, bore))
+        z = np.repeat((0.0, thickness, 0.0, thickness), n)
+        bore_bottom, bore_top = i + 2*n, i + 3*n
+    else:
+        xy = np.concatenate((ring, ring, np.zeros((2, 2))))
+        z = np.concatenate((np.repeat((0.0, thickness), n), (0.0, thickness)))
+        bore_bottom, bore_top = np.full(n, 2*n), np.full(n, 2*n + 1)
+    vertices = np.column_stack((xy, z))
+
+    # every face as (a, b, c) arrays of vertex indices
+    faces = [
+        # outer wall, two triangles per edge
+        (bottom, bottom[j], top[j]),
+        (bottom, top[j], top),
+        # top cap, looking down on a counterclockwise outline
+        (bore_top, top, top[j]),
+        # bottom cap, reversed
+        (bore_bottom, bottom[j], bottom),
+    ]
+    if bore_dia > 0:
+        faces += [
+            # the other half of the cap quads
+            (bore_top, top[j], bore_top[j]),
+            (bore_bottom, bore_bottom[j], bottom[j]),
+            # bore wall, facing the center
+            (bore_bottom, bore_top, bore_top[j]),
+            (bore_bottom, bore_top[j], bore_bottom[j]),
+        ]
+
+    triangles = np.stack([np.stack(face, axis=-1) for face in faces]).reshape(-1, 3)
+    return vertices, triangles
+
+def triangleNormals(vertices : np.ndarray, triangles : np.ndarray) -> np.ndarray:
+    # (T,3) unit normals; zero for zero area triangles
+    corners = vertices[triangles]
+    normal = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    length = np.linalg.norm(normal, axis=-1, keepdims=True)
+    return np.divide(normal, length, out=np.zeros_like(normal), where=length > 0)
@@ -0,0 +1,100 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Binary STL and 3MF writers for indexed triangle meshes (see mesh.py).
+#
+# The whole binary STL file is one preallocated buffer: the 80 byte header,
+# the triangle count and a structured array of 50 byte records on top of the
+# same memory. The records are filled with vectorized assignments and the
+# buffer is written in a single call.
+
+import zipfile
+
+import numpy as np
+
+from .mesh import triangleNormals
+
+STL_HEADER_SIZE = 80
+
+STL_RECORD = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attributes", "<u2"),
+])
+
+def stlBuffer(vertices : np.ndarray, triangles : np.ndarray, header : bytes = b"tapesprocketdesigner") -> np.ndarray:
+    # the complete binary STL file as a uint8 array
+    count = len(triangles)
+    buffer = np.zeros(STL_HEADER_SIZE + 4 + count*STL_RECORD.itemsize, dtype=np.uint8)
+    buffer[:min(len(header), STL_HEADER_SIZE)] = np.frombuffer(header[:STL_HEADER_SIZE], dtype=np.uint8)
+    buffer[STL_HEADER_SIZE:STL_HEADER_SIZE + 4] = np.frombuffer(np.uint32(count).astype("<u4").tobytes(), dtype=np.uint8)
+
+    records = buffer[STL_HEADER_SIZE + 4:].view(STL_RECORD)
+    records["normal"] = triangleNormals(vertices, triangles)
+    records["vertices"] = vertices[triangles]
+    return buffer
+
+def writeSTLMesh(stream, vertices : np.ndarray, triangles : np.ndarray):
+    # 'stream' is a binary file object
+    stream.write(stlBuffer(vertices, triangles))
+
+# 3MF core specification: a zip package with the model as XML
+MODEL_NAMESPACE = "http://schemas.microsoft.com/3dmanufacturing/core/2015/02"
+
+CONTENT_TYPES = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>
+</Types>
+"""
+
+RELATIONSHIPS = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>
+</Relationships>
+"""
+
+MODEL_HEADER = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<model unit="{unit:s}" xml:lang="en-US" xmlns="{ns:s}">
+<resources>
+<object id="1" type="model">
+<mesh>
+<vertices>
+"""
+
+MODEL_MIDDLE = """\
+</vertices>
+<triangles>
+"""
+
+MODEL_FOOTER = """\
+</triangles>
+</mesh>
+</object>
+</resources>
+<build>
+<item objectid="1"/>
+</build>
+</model>
+"""
+
+VERTEX = '<vertex x="%.6f" y="%.6f" z="%.6f"/>\n'
+TRIANGLE = '<triangle v1="%d" v2="%d" v3="%d"/>\n'
+
+def write3MFMesh(stream, vertices : np.ndarray, triangles : np.ndarray, unit : str = "millimeter"):
+    # 'stream' is a binary, seekable file object. 3MF meshes are indexed,
+    # so every vertex is stored once.
+    model = "".join((
+        MODEL_HEADER.format(unit=unit, ns=MODEL_NAMESPACE),
+        "".join([VERTEX % (x, y, z) for x, y, z in vertices.tolist()]),
+        MODEL_MIDDLE,
+        "".join([TRIANGLE % (a, b, c) for a, b, c in triangles.tolist()]),
+        MODEL_FOOTER))
+
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", CONTENT_TYPES)
+        package.writestr("_rels/.rels", RELATIONSHIPS)
+        package.writestr("3D/3dmodel.model", model)
@@ -0,0 +1,237 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Sheet nesting: pack many sprockets, of one design or a mix, onto sheets of
+# a given size, keeping a kerf gap between the parts and to the sheet edges.
+#
+# Every part is represented by its bounding circle (the outer radius plus half
+# the kerf). Parts are placed largest first, each at the lowest, then
+# leftmost, free position: candidate positions touch the sheet corner, a
+# sheet edge and a placed part, or two placed parts. Candidates live in a
+# heap, and placed parts in a uniform grid, so that checking a candidate, or
+# generating the new candidates of a placed part, only looks at the few cells
+# within reach. Placing hundreds of parts stays close to linear.
+
+import argparse
+import heapq
+import math
+import os
+from collections import defaultdict
+from typing import NamedTuple
+
+import numpy as np
+
+from .outline import bulgeArcs
+
+# positions may overlap by this much (rounding noise of touching circles)
+OVERLAP_TOLERANCE = 1e-9
+
+# candidates computed for a larger circle are free for a smaller one too, just
+# not as snug; they are recomputed once the radius drops by this fraction
+REBUILD_FRACTION = 0.1
+
+class NestedSheet(NamedTuple):
+    width : float
+    height : float
+    parts : np.ndarray          # (k,) index of every placed part in the input
+    centers : np.ndarray        # (k,2) where the center of each part goes
+    utilisation : float         # part area / sheet area
+
+class CircleGrid:
+    # uniform grid over the placed circles
+
+    def __init__(self, cellSize : float):
+        self.cellSize = cellSize
+        self.cells = defaultdict(list)
+        self.centers = []
+        self.radii = []
+        self.maxRadius = 0.0
+
+    def cell(self, x : float, y : float) -> tuple:
+        return (int(math.floor(x / self.cellSize)), int(math.floor(y / self.cellSize)))
+
+    def add(self, x : float, y : float, radius : float) -> int:
+        index = len(self.centers)
+        self.centers.append((x, y))
+        self.radii.append(radius)
+        self.cells[self.cell(x, y)].append(index)
+        self.maxRadius = max(self.maxRadius, radius)
+        return index
+
+    def neighbours(self, x : float, y : float, reach : float) -> list:
+        # circles with their center within 'reach' of (x, y), and maybe a few more
+        cx, cy = self.cell(x, y)
+        span = range(-int(math.ceil(reach / self.cellSize)), int(math.ceil(reach / self.cellSize)) + 1)
+        cells = self.cells
+        return [i for dx in span for dy in span for i in cells.get((cx+dx, cy+dy), ())]
+
+    def fits(self, x : float, y : float, radius : float) -> bool:
+        for i in self.neighbours(x, y, radius + self.maxRadius):
+            px, py = self.centers[i]
+            limit = self.radii[i] + radius - OVERLAP_TOLERANCE
+            if (px - x)**2 + (py - y)**2 < limit*limit:
+                return False
+        return True
+
+def touchingPositions(grid : CircleGrid, index : int, radius : float, width : float, height : float) -> list:
+    # centers of a circle of 'radius' touching placed circle 'index' and the
+    # bottom or left sheet edge, or another placed circle nearby
+    x0, y0 = grid.centers[index]
+    r0 = grid.radii[index] + radius
+    positions = []
+
+    for wall_y in (radius, height - radius):
+        h = r0*r0 - (y0 - wall_y)**2
+        if h >= 0:
+            positions += [(x0 - math.sqrt(h), wall_y), (x0 + math.sqrt(h), wall_y)]
+    for wall_x in (radius, width - radius):
+        h = r0*r0 - (x0 - wall_x)**2
+        if h >= 0:
+            positions += [(wall_x, y0 - math.sqrt(h)), (wall_x, y0 + math.sqrt(h))]
+
+    for other in grid.neighbours(x0, y0, r0 + grid.maxRadius + radius):
+        if other == index:
+            continue
+        x1, y1 = grid.centers[other]
+        r1 = grid.radii[other] + radius
+        dx, dy = x1 - x0, y1 - y0
+        d = math.hypot(dx, dy)
+        if d == 0 or d > r0 + r1:
+            continue
+        a = (r0*r0 - r1*r1 + d*d) / (2*d)
+        h = math.sqrt(max(r0*r0 - a*a, 0.0))
+        mx, my = x0 + a*dx/d, y0 + a*dy/d
+        positions += [(mx - h*dy/d, my + h*dx/d), (mx + h*dy/d, my - h*dx/d)]
+
+    return positions
+
+def nestCircles(radii, width : float, height : float, kerf : float = 0.0) -> tuple:
+    # Pack circles onto one sheet. Returns (placed part indices, centers (k,2),
+    # indices of the parts that did not fit). Centers are in sheet coordinates,
+    # origin at the bottom left corner.
+    radii = np.asarray(radii, dtype=np.float64)
+    grown = radii + kerf/2
+    inner_w = width - kerf
+    inner_h = height - kerf
+    grid = CircleGrid(2*grown.mean() if len(grown) else 1.0)
+
+    placed, centers, rejected = [], [], []
+    heap = []
+    heapRadius = None
+
+    # largest first; similar radii share the candidate heap
+    for part in sorted(range(len(radii)), key=lambda i: -grown[i]):
+        radius = grown[part]
+        if 2*radius > min(inner_w, inner_h):
+            rejected.append(part)
+            continue
+
+        if heapRadius is None or radius < heapRadius*(1 - REBUILD_FRACTION):
+            heapRadius = radius
+            heap = [(radius, radius)]
+            for index in range(len(grid.centers)):
+                heap += [(y, x) for x, y in touchingPositions(grid, index, radius, inner_w, inner_h)]
+            heapq.heapify(heap)
+
+        # lowest, then leftmost candidate that is still free; taken or
+        # blocked candidates stay blocked, so they are dropped for good
+        position = None
+        while heap:
+            y, x = heapq.heappop(heap)
+            if radius - OVERLAP_TOLERANCE <= x <= inner_w - radius + OVERLAP_TOLERANCE and \
+                radius - OVERLAP_TOLERANCE <= y <= inner_h - radius + OVERLAP_TOLERANCE and grid.fits(x, y, radius):
+                position = (x, y)
+                break
+        if position is None:
+            rejected.append(part)
+            continue
+
+        index = grid.add(position[0], position[1], radius)
+        for x, y in touchingPositions(grid, index, radius, inner_w, inner_h):
+            heapq.heappush(heap, (y, x))
+        placed.append(part)
+        centers.append(position)
+
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2) + kerf/2
+    return np.asarray(placed, dtype=np.int64), centers, rejected
+
+def outlineArea(outline) -> float:
+    # area enclosed by an outline, arcs included
+    v = outline.vertices
+    w = np.roll(v, -1, axis=0)
+    area = (v[:, 0]*w[:, 1] - w[:, 0]*v[:, 1]).sum() / 2
+    if outline.hasArcs():
+        # circular segment between every arc and its chord
+        _, radius, _, sweep = bulgeArcs(v, outline.bulges)
+        area += ((radius*radius / 2) * (sweep - np.sin(sweep))).sum()
+    return float(abs(area))
+
+def nestSheets(outlines, width : float, height : float, kerf : float = 0.0, maxSheets : int = 100) -> tuple:
+    # Nest a list of Outlines (centered on the origin) onto as many sheets as needed.
+    # Returns (list of NestedSheet, indices of parts that fit on no sheet).
+    radii = np.array([np.hypot(o.vertices[:, 0], o.vertices[:, 1]).max() for o in outlines])
+    areas = np.array([outlineArea(o) for o in outlines])
+
+    sheets = []
+    todo = np.arange(len(outlines))
+    while len(todo) and len(sheets) < maxSheets:
+        placed, centers, rejected = nestCircles(radii[todo], width, height, kerf)
+        if len(placed) == 0:
+            break
+        parts = todo[placed]
+        sheets.append(NestedSheet(width, height, parts, centers, float(areas[parts].sum() / (width*height))))
+        todo = todo[rejected]
+
+    return sheets, todo.tolist()
+
+def parseSheetSize(text : str) -> tuple:
+    # "600x300" -> (600.0, 300.0)
+    w, _, h = text.lower().partition("x")
+    return (float(w), float(h or w))
+
+def main(argv=None):
+    from .batch import readRows
+    from .geometry import computeSprockets
+    from .exporters import writeSheetDXF, writeSheetSVG
+
+    parser = argparse.ArgumentParser(prog="tapesprocketdesigner nest",
+        description="Nest sprockets from a CSV or JSONL parameter file onto sheets, as DXF or SVG.")
+    parser.add_argument("input", help="CSV or JSONL file with one design per row (see 'batch')")
+    parser.add_argument("-o", "--output", default="sheet.dxf",
+        help="output file, .dxf or .svg; further sheets get a _2, _3, ... suffix (default: %(default)s)")
+    parser.add_argument("--sheet", type=parseSheetSize, required=True, metavar="WxH", help="sheet size, e.g. 600x300")
+    parser.add_argument("--kerf", type=float, default=0.0, help="gap between the parts and to the sheet edges")
+    parser.add_argument("--count", type=int, default=1, help="copies of every design (default: %(default)s)")
+    parser.add_argument("--max-sheets", type=int, default=100, help="(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        rows = readRows(args.input)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.count < 1 or args.kerf < 0:
+        parser.error("--count must be at least 1 and --kerf not negative")
+
+    sprockets = computeSprockets([params for _, params in rows])
+    invalid = [name for (name, _), s in zip(rows, sprockets) if not s.isValid()]
+    if invalid:
+        # impossible parameters give outlines that cannot be cut, nothing is nested for them
+        print("{:d} invalid designs skipped: {:s}".format(len(invalid), ", ".join(invalid)))
+        sprockets = [s for s in sprockets if s.isValid()]
+        if not sprockets:
+            return 1
+
+    outlines = [s.outline for s in sprockets for _ in range(args.count)]
+    width, height = args.sheet
+    sheets, rejected = nestSheets(outlines, width, height, args.kerf, args.max_sheets)
+
+    base, ext = os.path.splitext(args.output)
+    writer = writeSheetSVG if ext.lower() == ".svg" else writeSheetDXF
+    for k, sheet in enumerate(sheets):
+        fileName = args.output if k == 0 else "{:s}_{:d}{:s}".format(base, k + 1, ext)
+        writer(fileName, sheet, outlines)
+        print("{:s}: {:d} parts, {:.1f}% utilisation".format(fileName, len(sheet.parts), 100*sheet.utilisation))
+
+    if rejected:
+        print("{:d} parts did not fit".format(len(rejected)))
+    return 1 if rejected or invalid else 0
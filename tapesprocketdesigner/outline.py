@@ -0,0 +1,162 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Array-backed closed outline.
+#
+# The outline is a single closed ring stored as one contiguous (n,2) float64
+# vertex buffer, each vertex stored once, plus an optional per-edge bulge
+# array for arcs and an optional (m,2) array of extra points (drill hits).
+# Whole-outline transforms are single vectorized operations, and exporters
+# and the canvas read the buffers directly.
+
+import math
+
+import numpy as np
+
+# most vertices a tessellated outline may have: a tolerance that is tiny
+# compared to the outline would otherwise take all memory
+MAX_TESSELLATED_VERTICES = 1 << 20
+
+# unit conversion factors
+MM_PER_INCH = 25.4
+UNIT_CONVERSIONS = {
+    "none" : 1.0,
+    "mm to inches" : 1.0 / MM_PER_INCH,
+    "inches to mm" : MM_PER_INCH,
+}
+
+class Outline:
+
+    def __init__(self, vertices, bulges = None, points = None):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float64).reshape(-1, 2)
+
+        # bulge of the edge from each vertex to the next one, None when all edges are straight
+        self.bulges = None if bulges is None else np.ascontiguousarray(bulges, dtype=np.float64).reshape(-1)
+        if self.bulges is not None and len(self.bulges) != len(self.vertices):
+            raise ValueError("Outline: need one bulge per vertex")
+
+        # extra points, e.g. drill hits
+        self.points = np.ascontiguousarray(np.zeros((0, 2)) if points is None else points,
+            dtype=np.float64).reshape(-1, 2)
+
+    def __len__(self) -> int:
+        return len(self.vertices)
+
+    def __array__(self, dtype = None, copy = None):
+        # np.asarray(outline) is a view of the vertex buffer, np.array(outline) a copy.
+        # copy=False with a dtype that needs a conversion raises, like for an ndarray.
+        if dtype is None or np.dtype(dtype) == self.vertices.dtype:
+            return self.vertices.copy() if copy else self.vertices
+        if copy is False:
+            raise ValueError("Outline: converting the vertices to {:s} needs a copy".format(str(np.dtype(dtype))))
+        return self.vertices.astype(dtype)
+
+    def buffer(self) -> memoryview:
+        return memoryview(self.vertices)
+
+    @property
+    def nbytes(self) -> int:
+        return self.vertices.nbytes + self.points.nbytes + (0 if self.bulges is None else self.bulges.nbytes)
+
+    def hasArcs(self) -> bool:
+        return self.bulges is not None and bool(self.bulges.any())
+
+    def segments(self) -> np.ndarray:
+        # (n,2,2) array of line segments; the last one closes the ring. This is a copy.
+        return np.stack((self.vertices, np.roll(self.vertices, -1, axis=0)), axis=1)
+
+    def bounds(self) -> tuple:
+        # (xmin, ymin, xmax, ymax) of the vertices; arcs may bulge out slightly further
+        lo = self.vertices.min(axis=0)
+        hi = self.vertices.max(axis=0)
+        return (lo[0], lo[1], hi[0], hi[1])
+
+    def transformed(self, matrix, offset = (0.0, 0.0)) -> "Outline":
+        # apply p' = matrix @ p + offset to the whole outline.
+        # Arcs stay arcs for rotations and uniform scaling; a mirroring matrix
+        # reverses their direction.
+        matrix = np.asarray(matrix, dtype=np.float64)
+        offset = np.asarray(offset, dtype=np.float64)
+        bulges = self.bulges
+        if bulges is not None and np.linalg.det(matrix) < 0:
+            bulges = -bulges
+        return Outline(self.vertices @ matrix.T + offset, bulges, self.points @ matrix.T + offset)
+
+    def scaled(self, factor : float) -> "Outline":
+        return self.transformed(np.eye(2) * factor)
+
+    def rotated(self, degrees : float) -> "Outline":
+        c = math.cos(math.radians(degrees))
+        s = math.sin(math.radians(degrees))
+        return self.transformed(((c, -s), (s, c)))
+
+    def translated(self, dx : float, dy : float) -> "Outline":
+        return Outline(self.vertices + (dx, dy), self.bulges, self.points + (dx, dy))
+
+    def converted(self, conversion : str) -> "Outline":
+        # conversion is one of the UNIT_CONVERSIONS keys
+        factor = UNIT_CONVERSIONS[conversion]
+        return self if factor == 1.0 else self.scaled(factor)
+
+    def tessellate(self, tolerance : float) -> "Outline":
+        # outline with the arcs replaced by chords that stay within 'tolerance' of the arc
+        if not self.hasArcs():
+            return self
+        return Outline(tessellate(self.vertices, self.bulges, tolerance), None, self.points)
+
+def bulgeArcs(vertices, bulges):
+    # Arc geometry for every edge of a closed ring with bulges:
+    # returns center (n,2), radius (n,), start angle (n,) and sweep (n,) in radians.
+    # Straight edges get a radius and sweep of 0.
+    p0 = np.asarray(vertices, dtype=np.float64)
+    p1 = np.roll(p0, -1, axis=0)
+    bulges = np.asarray(bulges, dtype=np.float64)
+    is_arc = bulges != 0
+    safe = np.where(is_arc, bulges, 1.0)
+
+    chord = p1 - p0
+    chord_len = np.hypot(chord[:,0], chord[:,1])
+    sweep = np.where(is_arc, 4 * np.arctan(bulges), 0.0)
+
+    # the center lies on the chord's left normal for counterclockwise arcs
+    normal = np.stack((-chord[:,1], chord[:,0]), axis=-1)
+    center = (p0 + p1) / 2 + normal * ((1 - safe*safe) / (4 * safe))[:, np.newaxis]
+    half_sin = np.where(is_arc, np.abs(np.sin(sweep / 2)), 1.0)
+    radius = np.where(is_arc, chord_len / (2 * half_sin), 0.0)
+    start = np.arctan2(p0[:,1] - center[:,1], p0[:,0] - center[:,0])
+
+    return center, radius, start, sweep
+
+def chordCounts(vertices, bulges, tolerance : float, arcs : tuple = None) -> np.ndarray:
+    # number of chords every edge of a closed ring is replaced by in tessellate;
+    # 'arcs' is the result of bulgeArcs when the caller has it already
+    if tolerance <= 0:
+        raise ValueError("tessellate: tolerance must be positive")
+    _, radius, _, sweep = arcs or bulgeArcs(vertices, bulges)
+
+    # largest angle whose chord stays within the tolerance
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = 2 * np.arccos(np.clip(1 - tolerance / radius, -1.0, 1.0))
+    count = np.where(sweep != 0, np.ceil(np.abs(sweep) / np.maximum(step, 1e-9)), 1).astype(np.int64)
+    return np.maximum(count, 1)
+
+def tessellate(vertices, bulges, tolerance : float) -> np.ndarray:
+    # Replace every arc edge of a closed ring by as few chords as needed to stay
+    # within 'tolerance' (the maximum distance between chord and arc).
+    # All edges are expanded in one vectorized pass. Raises ValueError when the
+    # result would have more than MAX_TESSELLATED_VERTICES vertices.
+    vertices = np.asarray(vertices, dtype=np.float64)
+    arcs = bulgeArcs(vertices, bulges)
+    center, radius, start, sweep = arcs
+    count = chordCounts(vertices, bulges, tolerance, arcs)
+    if count.sum() > MAX_TESSELLATED_VERTICES:
+        raise ValueError("tessellate: a tolerance of {:g} would give more than {:d} vertices".format(
+            tolerance, MAX_TESSELLATED_VERTICES))
+
+    # every edge contributes its start vertex plus (count-1) points along the arc
+    edge = np.repeat(np.arange(len(vertices)), count)
+    k = np.arange(len(edge)) - np.repeat(np.cumsum(count) - count, count)
+    angle = start[edge] + sweep[edge] * (k / count[edge])
+    points = center[edge] + radius[edge][:, np.newaxis] * np.stack((np.cos(angle), np.sin(angle)), axis=-1)
+
+    return np.where((k == 0)[:, np.newaxis], vertices[edge], points)
@@ -0,0 +1,191 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Opt-in timing instrumentation.
+#
+# The code is sprinkled with named spans:
+#
+#   with span("geometry"):
+#       sprocket = computeSprocket(params)
+#
+# When instrumentation is off (the default) span() returns a shared no-op
+# context manager, so the spans cost next to nothing. When it is on, every
+# span records its count and total, min and max duration. Spans used so far:
+#
+#   parse               reading the parameters, from the GUI fields or a batch file
+#   geometry            sprocket computation, .tessellate and .engagement below it
+#   canvas.update       showing a new result: canvas outline and report fields
+#   canvas.render       drawing the outline into the canvas pixmap
+#   canvas.paint        SprocketCanvas.paintEvent
+#   export.<format>     writing a file, serialization and file I/O together
+#   write.<format>      the file I/O part of export.<format>
+#
+# Instrumentation is switched on with the TAPESPROCKETDESIGNER_PROFILE
+# environment variable or the --profile option (see cli.py). Its value is a
+# JSON file that the results are written to at exit, or "1" for a summary on
+# stderr. TAPESPROCKETDESIGNER_CPROFILE / --cprofile additionally run the
+# whole program under cProfile and write the stats to the given file (main
+# thread only, the GUI computes on a worker thread).
+#
+# Only spans of the current process are collected: use -j 1 to include the
+# work of batch workers.
+
+import os
+import sys
+import threading
+import time
+
+PROFILE_VARIABLE = "TAPESPROCKETDESIGNER_PROFILE"
+CPROFILE_VARIABLE = "TAPESPROCKETDESIGNER_CPROFILE"
+
+class SpanStats:
+
+    __slots__ = ("count", "total", "min", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, duration : float):
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.last = duration
+
+    def asDict(self) -> dict:
+        return {
+            "count" : self.count,
+            "total_s" : self.total,
+            "mean_s" : self.total / self.count if self.count else 0.0,
+            "min_s" : self.min if self.count else 0.0,
+            "max_s" : self.max,
+            "last_s" : self.last,
+        }
+
+class Span:
+
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name : str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.t0)
+        return False
+
+class NoSpan:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NO_SPAN = NoSpan()
+
+enabled = False
+stats = {}              # span name -> SpanStats
+lock = threading.Lock()
+output = None           # JSON file for the results, None for a summary on stderr
+profiler = None         # cProfile.Profile while running under cProfile
+profilerOutput = None
+
+def span(name : str):
+    return Span(name) if enabled else NO_SPAN
+
+def record(name : str, duration : float):
+    with lock:
+        entry = stats.get(name)
+        if entry is None:
+            entry = stats[name] = SpanStats()
+        entry.add(duration)
+
+def enable(outputFile : str = None):
+    global enabled, output
+    enabled = True
+    output = outputFile
+
+def isEnabled() -> bool:
+    return enabled
+
+def reset():
+    with lock:
+        stats.clear()
+
+def results() -> dict:
+    with lock:
+        return { name : entry.asDict() for name, entry in sorted(stats.items()) }
+
+def summary() -> str:
+    lines = ["{:24s} {:>8s} {:>12s} {:>12s} {:>12s}".format("span", "count", "total ms", "mean ms", "max ms")]
+    for name, entry in results().items():
+        lines.append("{:24s} {:8d} {:12.3f} {:12.3f} {:12.3f}".format(name, entry["count"],
+            1000*entry["total_s"], 1000*entry["mean_s"], 1000*entry["max_s"]))
+    return "\n".join(lines)
+
+def statusLine(names) -> str:
+    # last duration of the given spans, for a status bar
+    with lock:
+        return "   ".join("{:s} {:.1f} ms".format(name, 1000*stats[name].last) for name in names if name in stats)
+
+class TimedStream:
+    # file object wrapper that records the time spent in write() under a span
+
+    def __init__(self, stream, name : str):
+        self.stream = stream
+        self.name = name
+
+    def write(self, data):
+        t0 = time.perf_counter()
+        try:
+            return self.stream.write(data)
+        finally:
+            record(self.name, time.perf_counter() - t0)
+
+    def __getattr__(self, attribute):
+        return getattr(self.stream, attribute)
+
+def timedStream(stream, name : str):
+    return TimedStream(stream, name) if enabled else stream
+
+def startProfiler(outputFile : str):
+    global profiler, profilerOutput
+    import cProfile
+    profiler = cProfile.Profile()
+    profilerOutput = outputFile
+    profiler.enable()
+
+def configure(profileOutput : str = None, cprofileOutput : str = None):
+    # called once at startup: command line values win over the environment
+    profileOutput = profileOutput or os.environ.get(PROFILE_VARIABLE)
+    cprofileOutput = cprofileOutput or os.environ.get(CPROFILE_VARIABLE)
+    if profileOutput:
+        enable(None if profileOutput == "1" else profileOutput)
+    if cprofileOutput:
+        startProfiler(cprofileOutput)
+
+def finish():
+    # writes the results; called once at exit
+    global profiler
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profilerOutput)
+        profiler = None
+    if not enabled:
+        return
+    if output:
+        import json
+        with open(output, "w") as f:
+            json.dump({ "spans" : results() }, f, indent=2)
+    else:
+        print(summary(), file=sys.stderr)
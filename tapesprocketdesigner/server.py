@@ -0,0 +1,348 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Local generation service: other tools request sprocket outlines over HTTP/JSON.
+#
+#   tapesprocketdesigner serve --port 8765
+#
+#   POST /sprocket          parameters as JSON, same fields as a batch JSONL row, plus
+#                           optional "formats" (any of dxf, svg, outline), "tessellate"
+#                           and "svg_precision". Returns the diameters, the tape
+#                           clearance and the requested outputs as JSON.
+#   POST /sprocket.dxf      the DXF or SVG file itself
+#   POST /sprocket.svg
+#   GET  /health            status and metrics
+#
+# Connections are handled on an asyncio event loop and the geometry and file
+# serialization run in a bounded pool of worker processes. Identical requests
+# that arrive while one is being computed wait for the same result instead of
+# computing it again, and finished results are kept in an LRU cache. When more
+# than --max-pending distinct requests are being computed, new ones get a 503
+# so that clients can back off.
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .geometry import SprocketParameters, computeSprocket
+from .exporters import writeDXF, writeSVG
+from .engagement import checkEngagement
+from .cache import GeometryCache, cacheKey
+from .batch import parseParameters
+
+OUTPUT_FORMATS = ("dxf", "svg", "outline")
+
+CONTENT_TYPES = {
+    "json" : "application/json",
+    "dxf" : "application/dxf",
+    "svg" : "image/svg+xml",
+}
+
+STATUS_TEXT = {
+    200 : "OK",
+    400 : "Bad Request",
+    404 : "Not Found",
+    405 : "Method Not Allowed",
+    413 : "Payload Too Large",
+    422 : "Unprocessable Entity",
+    500 : "Internal Server Error",
+    503 : "Service Unavailable",
+}
+
+# limits on what a single request may ask for
+MAX_BODY = 1 << 20
+MAX_TEETH = 10000
+
+# idle keep-alive connections are closed after this many seconds
+KEEPALIVE_TIMEOUT = 30.0
+
+# number of recent requests the latency percentiles are taken over
+LATENCY_WINDOW = 1000
+
+class RequestError(Exception):
+
+    def __init__(self, status : int, message : str):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+def generate(params : SprocketParameters, formats : tuple, tolerance : float, precision : int) -> dict:
+    # Worker process entry point. Raises ValueError for impossible parameters, and
+    # for a tolerance that would give too many vertices (see Outline.tessellate).
+    # Returns the encoded response bodies: the JSON document under "json" and
+    # the DXF/SVG files under their format, so that the event loop only has
+    # to send bytes, and the time it took under "compute_s".
+    t0 = time.perf_counter()
+    try:
+        sprocket = computeSprocket(params)
+        valid = sprocket.isValid()
+    except ZeroDivisionError:
+        valid = False
+    if not valid:
+        raise ValueError("the parameters do not describe a valid sprocket")
+
+    outline = sprocket.outline.tessellate(tolerance) if tolerance else sprocket.outline
+    outputs = {}
+    for fmt in formats:
+        if fmt == "outline":
+            bulges = np.zeros(len(outline)) if outline.bulges is None else outline.bulges
+            outputs[fmt] = { "vertices" : outline.vertices.tolist(), "bulges" : bulges.tolist() }
+            continue
+        stream = io.StringIO()
+        if fmt == "dxf":
+            writeDXF(stream, outline)
+        else:
+            writeSVG(stream, outline, sprocket.max_outer_radius, precision)
+        outputs[fmt] = stream.getvalue()
+
+    result = {
+        "parameters" : params._asdict(),
+        "inner_diameter" : sprocket.inner_radius * 2,
+        "design_diameter" : sprocket.design_radius * 2,
+        "outer_diameter" : sprocket.outer_radius * 2,
+        "max_outer_diameter" : sprocket.max_outer_radius * 2,
+        "tape_clearance" : checkEngagement(sprocket).min_clearance,
+        "outputs" : outputs
+    }
+    bodies = { fmt : outputs[fmt].encode("utf-8") for fmt in formats if fmt != "outline" }
+    bodies["json"] = json.dumps(result).encode("utf-8")
+    bodies["compute_s"] = time.perf_counter() - t0
+    return bodies
+
+def warmUp() -> int:
+    # run once in every worker, so that the first real request does not pay for the imports
+    generate(SprocketParameters(), OUTPUT_FORMATS, None, 3)
+    return os.getpid()
+
+def parseRequest(body : bytes, fmt : str = None) -> tuple:
+    # request body -> arguments of generate(). Raises RequestError.
+    try:
+        record = json.loads(body.decode("utf-8") or "{}")
+    except (UnicodeDecodeError, ValueError) as e:
+        raise RequestError(400, "invalid JSON: " + str(e))
+    if not isinstance(record, dict):
+        raise RequestError(400, "expected a JSON object")
+
+    try:
+        params = parseParameters(record)
+        tolerance = record.get("tessellate")
+        tolerance = float(tolerance) if tolerance is not None else None
+        precision = int(record.get("svg_precision", 3))
+    except KeyError as e:
+        raise RequestError(400, "missing field " + str(e))
+    except (TypeError, ValueError) as e:
+        raise RequestError(400, str(e))
+
+    if fmt is not None:
+        formats = (fmt,)
+    else:
+        formats = record.get("formats", OUTPUT_FORMATS)
+        if isinstance(formats, str):
+            formats = formats.split(",")
+        if not isinstance(formats, list) and not isinstance(formats, tuple):
+            raise RequestError(400, "'formats' must be a list")
+        formats = tuple(sorted(set(str(f).strip().lower() for f in formats)))
+        for f in formats:
+            if f not in OUTPUT_FORMATS:
+                raise RequestError(400, "unknown output format '{:s}'".format(f))
+
+    if not (1 <= params.n_teeth <= MAX_TEETH):
+        raise RequestError(422, "n_teeth must be between 1 and {:d}".format(MAX_TEETH))
+    if tolerance is not None and tolerance <= 0:
+        raise RequestError(400, "'tessellate' needs a positive tolerance")
+    if not (0 <= precision <= 12):
+        raise RequestError(400, "'svg_precision' must be between 0 and 12")
+
+    return params, formats, tolerance, precision
+
+class SprocketServer:
+
+    def __init__(self, jobs : int = None, maxPending : int = 64, cacheSize : int = 1024):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.maxPending = maxPending
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs)
+        self.cache = GeometryCache(cacheSize)
+        self.inFlight = {}          # cache key -> future of the computation
+        self.started = time.time()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.metrics = {
+            "requests" : 0,
+            "computed" : 0,
+            "coalesced" : 0,
+            "rejected" : 0,
+            "compute_s" : 0.0,
+        }
+        self.responses = {}         # status -> count
+
+    async def start(self):
+        # starts all workers and runs the imports and a first sprocket in them
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, warmUp) for _ in range(self.jobs)])
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+    async def result(self, args : tuple) -> dict:
+        key = cacheKey(*args)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        future = self.inFlight.get(key)
+        if future is not None:
+            self.metrics["coalesced"] += 1
+        else:
+            if len(self.inFlight) >= self.maxPending:
+                self.metrics["rejected"] += 1
+                raise RequestError(503, "too many requests in progress")
+            future = asyncio.get_running_loop().create_task(self.compute(key, args))
+            self.inFlight[key] = future
+
+        # a client that goes away must not cancel the computation for the others
+        return await asyncio.shield(future)
+
+    async def compute(self, key : tuple, args : tuple) -> dict:
+        try:
+            bodies = await asyncio.get_running_loop().run_in_executor(self.pool, generate, *args)
+        except ValueError as e:
+            raise RequestError(422, str(e))
+        except BrokenProcessPool:
+            # a crashed worker takes the pool down; start a fresh one for the next requests
+            self.pool = ProcessPoolExecutor(max_workers=self.jobs)
+            raise RequestError(500, "worker process failed")
+        finally:
+            self.inFlight.pop(key, None)
+        self.metrics["computed"] += 1
+        self.metrics["compute_s"] += bodies["compute_s"]
+        self.cache.put(key, bodies)
+        return bodies
+
+    def health(self) -> dict:
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            return 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+        return dict(self.metrics,
+            status = "ok",
+            uptime_s = time.time() - self.started,
+            workers = self.jobs,
+            in_flight = len(self.inFlight),
+            max_pending = self.maxPending,
+            responses = { str(k) : v for k, v in sorted(self.responses.items()) },
+            latency_ms = { "p50" : percentile(0.5), "p95" : percentile(0.95), "max" : percentile(1.0) },
+            cache = self.cache.stats())
+
+    async def dispatch(self, method : str, path : str, body : bytes) -> tuple:
+        # returns (status, content type, body)
+        path = path.split("?", 1)[0].rstrip("/") or "/"
+        if path == "/health":
+            if method != "GET":
+                raise RequestError(405, "use GET")
+            return 200, CONTENT_TYPES["json"], json.dumps(self.health()).encode("utf-8")
+
+        name, _, fmt = path.partition(".")
+        if name != "/sprocket" or (fmt and fmt not in ("dxf", "svg")):
+            raise RequestError(404, "unknown path " + path)
+        if method != "POST":
+            raise RequestError(405, "use POST")
+
+        bodies = await self.result(parseRequest(body, fmt or None))
+        return 200, CONTENT_TYPES[fmt or "json"], bodies[fmt or "json"]
+
+    async def handleConnection(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        # minimal HTTP/1.1: Content-Length bodies, keep-alive, no chunked transfer encoding
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not line.strip():
+                    break
+
+                t0 = time.perf_counter()
+                keepAlive = True
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                    headers = {}
+                    while True:
+                        header = await reader.readline()
+                        if header in (b"\r\n", b"\n", b""):
+                            break
+                        field, _, value = header.decode("latin-1").partition(":")
+                        headers[field.strip().lower()] = value.strip()
+
+                    connection = headers.get("connection", "").lower()
+                    keepAlive = (connection == "keep-alive") if version == "HTTP/1.0" else (connection != "close")
+                    length = int(headers.get("content-length", "0"))
+                    if length > MAX_BODY:
+                        keepAlive = False
+                        raise RequestError(413, "request body larger than {:d} bytes".format(MAX_BODY))
+                    body = await reader.readexactly(length) if length > 0 else b""
+
+                    self.metrics["requests"] += 1
+                    status, contentType, data = await self.dispatch(method, target, body)
+                except RequestError as e:
+                    status, contentType = e.status, CONTENT_TYPES["json"]
+                    data = json.dumps({ "error" : str(e) }).encode("utf-8")
+                except ValueError:
+                    # malformed request line or header
+                    status, contentType, keepAlive = 400, CONTENT_TYPES["json"], False
+                    data = json.dumps({ "error" : "malformed request" }).encode("utf-8")
+                except MemoryError:
+                    # in this process or a worker; the request is dropped, the service keeps running
+                    status, contentType, keepAlive = 500, CONTENT_TYPES["json"], False
+                    data = json.dumps({ "error" : "out of memory" }).encode("utf-8")
+
+                self.responses[status] = self.responses.get(status, 0) + 1
+                writer.write("HTTP/1.1 {:d} {:s}\r\nContent-Type: {:s}\r\nContent-Length: {:d}\r\nConnection: {:s}\r\n\r\n".format(
+                    status, STATUS_TEXT[status], contentType, len(data), "keep-alive" if keepAlive else "close").encode("latin-1"))
+                writer.write(data)
+                await writer.drain()
+                self.latencies.append(time.perf_counter() - t0)
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(host : str, port : int, jobs : int = None, maxPending : int = 64, cacheSize : int = 1024):
+    server = SprocketServer(jobs, maxPending, cacheSize)
+    try:
+        await server.start()
+        listener = await asyncio.start_server(server.handleConnection, host, port)
+        print("serving on http://{:s}:{:d} with {:d} workers".format(host, port, server.jobs), flush=True)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="tapesprocketdesigner serve",
+        description="Serve sprocket geometry and DXF/SVG files over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind to (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8765, help="(default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--max-pending", type=int, default=64,
+        help="distinct requests computed at the same time before new ones get a 503 (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=1024,
+        help="number of results kept in memory (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1 or args.max_pending < 1 or args.cache_size < 1:
+        parser.error("--jobs, --max-pending and --cache-size must be at least 1")
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.jobs, args.max_pending, args.cache_size))
+    except KeyboardInterrupt:
+        pass
+    return 0
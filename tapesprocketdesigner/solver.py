@@ -0,0 +1,111 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Parameter solver: find the number of teeth and tooth length that give an
+# outer diameter within given bounds, for a fixed pitch, tooth width and
+# flank height.
+#
+# The radius formulas of geometry.computeRadii are evaluated over the whole
+# grid of candidate teeth counts and tooth lengths in one vectorized pass.
+
+import argparse
+import json
+from typing import NamedTuple
+
+import numpy as np
+
+from .geometry import SprocketParameters, computeRadii, validDesigns
+
+class SolverResult(NamedTuple):
+    params : SprocketParameters
+    inner_diameter : float
+    design_diameter : float
+    outer_diameter : float
+    max_outer_diameter : float
+    error : float               # outer diameter - target
+
+def solveDesigns(tooth_dia : float, tooth_pitch : float, flank_height : float,
+    min_outer_diameter : float, max_outer_diameter : float, target : float = None,
+    teeth = (3, 200), pct_step : float = 1.0, max_results : int = 20) -> list:
+    # Returns up to max_results SolverResults with an outer diameter within
+    # [min_outer_diameter, max_outer_diameter], closest to 'target' (default:
+    # the middle of the bounds) first; ties go to fewer teeth, then longer teeth.
+    if target is None:
+        target = (min_outer_diameter + max_outer_diameter) / 2.0
+    if pct_step <= 0:
+        raise ValueError("solveDesigns: pct_step must be positive")
+
+    n_teeth = np.arange(int(teeth[0]), int(teeth[1]) + 1)[:, np.newaxis]
+    pct = np.arange(0.0, 100.0 + pct_step/2, pct_step)
+    pct = np.minimum(pct, 100.0)[np.newaxis, :]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        radii = computeRadii(n_teeth, tooth_dia, tooth_pitch, flank_height, pct)
+        outer = np.broadcast_to(2 * radii.outer_radius, (n_teeth.shape[0], pct.shape[1]))
+        # only designs that Sprocket.isValid accepts
+        valid = validDesigns((n_teeth, tooth_dia, tooth_pitch, flank_height, pct), radii) & \
+            (outer >= min_outer_diameter) & (outer <= max_outer_diameter)
+
+    rows, cols = np.nonzero(valid)
+    error = outer[rows, cols] - target
+
+    # np.lexsort sorts by the last key first
+    order = np.lexsort((-pct[0, cols], n_teeth[rows, 0], np.abs(error)))[:max_results]
+    rows, cols, error = rows[order], cols[order], error[order]
+
+    inner = np.broadcast_to(2 * radii.inner_radius, outer.shape)
+    design = np.broadcast_to(2 * radii.design_radius, outer.shape)
+    max_outer = np.broadcast_to(2 * radii.max_outer_radius, outer.shape)
+
+    results = []
+    for r, c, e in zip(rows.tolist(), cols.tolist(), error.tolist()):
+        params = SprocketParameters(int(n_teeth[r, 0]), float(tooth_dia), float(tooth_pitch),
+            float(flank_height), float(pct[0, c]))
+        results.append(SolverResult(params, float(inner[r, c]), float(design[r, c]),
+            float(outer[r, c]), float(max_outer[r, c]), e))
+    return results
+
+def parseRange(text : str) -> tuple:
+    # "3:200" -> (3, 200)
+    lo, _, hi = text.partition(":")
+    return (int(lo), int(hi or lo))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="tapesprocketdesigner solve",
+        description="Find the number of teeth and tooth length for a target outer diameter.")
+    parser.add_argument("--tooth-dia", type=float, required=True, help="tooth width/diameter")
+    parser.add_argument("--pitch", type=float, required=True, help="tooth spacing (pitch)")
+    parser.add_argument("--flank-height", type=float, required=True, help="tooth flank height")
+    parser.add_argument("--min-outer", type=float, required=True, help="smallest acceptable outer diameter")
+    parser.add_argument("--max-outer", type=float, required=True, help="largest acceptable outer diameter")
+    parser.add_argument("--target", type=float, default=None,
+        help="preferred outer diameter (default: middle of the bounds)")
+    parser.add_argument("--teeth", type=parseRange, default=(3, 200),
+        help="range of teeth counts to try, MIN:MAX (default: 3:200)")
+    parser.add_argument("--pct-step", type=float, default=1.0,
+        help="tooth length step in percent (default: %(default)s)")
+    parser.add_argument("-n", "--results", type=int, default=10, help="number of designs to show (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = solveDesigns(args.tooth_dia, args.pitch, args.flank_height, args.min_outer, args.max_outer,
+        args.target, args.teeth, args.pct_step, args.results)
+
+    if args.json:
+        for result in results:
+            entry = result._asdict()
+            entry["params"] = result.params._asdict()
+            print(json.dumps(entry))
+        return 0
+
+    if not results:
+        print("no design meets the outer diameter bounds")
+        return 1
+
+    print("{:>6s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s} {:>8s}".format(
+        "teeth", "length%", "inner", "design", "outer", "max.outer", "error"))
+    for r in results:
+        print("{:6d} {:8.1f} {:10.3f} {:10.3f} {:10.3f} {:10.3f} {:8.3f}".format(r.params.n_teeth,
+            r.params.tooth_length_pct, r.inner_diameter, r.design_diameter, r.outer_diameter,
+            r.max_outer_diameter, r.error))
+    return 0
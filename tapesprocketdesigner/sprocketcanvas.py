@@ -1,50 +1,90 @@
 # Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
 # SPDX-License-Identifier: GPL-3.0-only
 
-from PySide6.QtWidgets import *
-from PySide6.QtGui import *
+from PySide6.QtWidgets import QWidget
+from PySide6.QtGui import QPainter, QPainterPath, QPolygonF, QPixmap, QBrush, QColor, QPen
 from PySide6.QtCore import Qt, QPointF
 
+from .profiling import span
+
 class SprocketCanvas(QWidget):
 
     def __init__(self):
         super().__init__()
-        self.lines = []
+        self.outline = None
+        self.path = QPainterPath()
         self.userOuterRadius = 1000000
         self.circleRadius = 0.0
+        self.k = 1.0
+
+        # background and outline are rendered into this pixmap once per
+        # setOutline/resize, repaints for the hover circle only blit it.
+        self.cache = None
 
     def paintEvent(self, paintEvent):
-        painter = QPainter(self)
+        with span("canvas.paint"):
+            if self.cache is None:
+                with span("canvas.render"):
+                    self.cache = self.renderCache()
+
+            painter = QPainter(self)
+            painter.drawPixmap(0, 0, self.cache)
+
+            if (self.circleRadius > 0):
+                center = self.rect().center()
+                painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.setPen(QPen(QColor('green'), 2))
+                painter.drawEllipse(center, self.k*self.circleRadius, self.k*self.circleRadius)
+            painter.end()
+
+    def renderCache(self) -> QPixmap:
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(self.size() * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+
+        painter = QPainter(pixmap)
         brush = QBrush()
         brush.setColor(QColor('lightgrey'))
         brush.setStyle(Qt.BrushStyle.SolidPattern)
         painter.fillRect(self.rect(), brush)
 
+        # the whole outline is transformed by the painter, in one drawPath call
         center = self.rect().center()
+        painter.translate(center.x(), center.y())
+        painter.scale(self.k, -self.k)
 
+        pen = QPen(QColor('black'))
+        pen.setCosmetic(True)
         painter.setBrush(Qt.BrushStyle.NoBrush)
-        painter.setPen(QColor('black'))
-        for L in self.lines:
-            start = QPointF(center.x() + self.k*L[0][0], center.y() - self.k*L[0][1])
-            stop  = QPointF(center.x() + self.k*L[1][0], center.y() - self.k*L[1][1])
-            painter.drawLine(start, stop)
-
-        if (self.circleRadius > 0):
-            painter.setPen(QPen(QColor('green'), 2))
-            painter.drawEllipse(center, self.k*self.circleRadius, self.k*self.circleRadius)
-            
+        painter.setPen(pen)
+        painter.drawPath(self.path)
+        painter.end()
+
+        return pixmap
+
     def setCircle(self, radius : float):
         self.circleRadius = radius
         self.update()
 
-    def setLines(self, lines, user_outer_radius):
-        self.lines = lines
-        self.userOuterRadius = user_outer_radius        
-        self.k = ((min(self.width(), self.height()) + 0.0) / (self.userOuterRadius*2.0)) * 0.75
+    def setOutline(self, outline, user_outer_radius):
+        # outline: Outline with straight edges (tessellate arcs first)
+        self.outline = outline
+        self.userOuterRadius = user_outer_radius
+
+        self.path = QPainterPath()
+        if outline is not None and len(outline) > 0:
+            self.path.addPolygon(QPolygonF([QPointF(x, y) for x, y in outline.vertices.tolist()]))
+            self.path.closeSubpath()
+
+        self.updateScale()
         self.update()
 
-    def getLines(self): 
-        return self.lines
+    def getOutline(self):
+        return self.outline
 
-    def resizeEvent(self, sizeEvent):
+    def updateScale(self):
         self.k = ((min(self.width(), self.height()) + 0.0) / (self.userOuterRadius*2.0)) * 0.75
+        self.cache = None
+
+    def resizeEvent(self, sizeEvent):
+        self.updateScale()
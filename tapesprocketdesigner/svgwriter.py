@@ -0,0 +1,127 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Compact SVG output.
+#
+# The path data is built in one pass from the vertex array. Every vertex is
+# emitted either as an absolute or a relative lineto, whichever is shorter,
+# repeated command letters are left out and numbers are written with the
+# requested number of decimals without trailing zeros.
+#
+# Relative steps are computed from the already rounded absolute coordinates,
+# so rounding errors do not accumulate along the path.
+
+import numpy as np
+
+from .outline import bulgeArcs
+
+SVG_HEADER = """\
+<?xml version="1.0" encoding="utf-8" ?>
+<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{width}mm" height="{height}mm" viewBox="0 0 {width} {height}">
+"""
+
+SVG_PATH = """\
+<path d="{d}" fill="none" stroke="black" stroke-width="{stroke}" />
+"""
+
+SVG_FOOTER = "</svg>\n"
+
+def formatNumbers(values, precision : int) -> list:
+    # shortest text for every value at the given precision: "0.500" -> ".5", "-0.000" -> "0"
+    fmt = "{:.%df}" % precision
+    result = []
+    for v in values:
+        s = fmt.format(v)
+        if "." in s:
+            s = s.rstrip("0").rstrip(".")
+        if s.startswith("0."):
+            s = s[1:]
+        elif s.startswith("-0."):
+            s = "-" + s[2:]
+        elif s == "-0":
+            s = "0"
+        result.append(s)
+    return result
+
+def separator(previous : str, number : str) -> str:
+    # a minus sign, or a second decimal point, already ends the previous number
+    if number.startswith("-") or (number.startswith(".") and "." in previous):
+        return ""
+    return " "
+
+def pathData(vertices, precision : int = 3, closed : bool = True, bulges = None) -> str:
+    # vertices: (n,2) array, returns the contents of a path 'd' attribute.
+    # bulges: optional (n,) array, DXF style bulge of the edge starting at each
+    # vertex; edges with a non-zero bulge are written as elliptical arc commands.
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    if len(vertices) == 0:
+        return ""
+
+    n = len(vertices)
+    if bulges is None:
+        bulges = np.zeros(n)
+    bulges = np.asarray(bulges, dtype=np.float64)
+
+    # an arc on the closing edge has to be written explicitly before the Z
+    rounded = np.round(vertices, precision)
+    if closed and bulges[-1] != 0:
+        rounded = np.concatenate((rounded, rounded[:1]))
+    edges = len(rounded) - 1
+
+    deltas = np.diff(rounded, axis=0)
+    absolute = formatNumbers(rounded.ravel().tolist(), precision)
+    relative = formatNumbers(deltas.ravel().tolist(), precision)
+
+    # arc parameters: radius, large arc flag and sweep flag (1 = counterclockwise,
+    # the SVG y axis points down but the page is not mirrored)
+    _, radius, _, sweep = bulgeArcs(vertices, bulges)
+    radii = formatNumbers(radius.tolist(), precision)
+    arcFlags = ["{:d} {:d}".format(int(abs(a) > np.pi), int(a > 0)) for a in sweep.tolist()]
+
+    x, y = absolute[0], absolute[1]
+    parts = ["M", x, separator(x, y), y]
+    command = "M"     # coordinate pairs following M are implicit absolute linetos
+    for i in range(edges):
+        ax, ay = absolute[2*i+2], absolute[2*i+3]
+        rx, ry = relative[2*i], relative[2*i+1]
+
+        if bulges[i % n] != 0:
+            r = radii[i % n]
+            prefix = r + separator(r, r) + r + " 0 " + arcFlags[i % n]
+            a_cmd, r_cmd = "A", "a"
+        else:
+            prefix = ""
+            a_cmd, r_cmd = "L", "l"
+
+        # the sweep flag is always followed by a space: with "1.589" or "1-2" many
+        # readers take the flag and the next coordinate for one number
+        a_text = prefix + (" " if prefix else "") + ax + separator(ax, ay) + ay
+        r_text = prefix + (" " if prefix else "") + rx + separator(rx, ry) + ry
+
+        # lineto commands directly after M are implicit
+        current = "L" if command == "M" else command
+
+        # cost of each option, including the command letter or separator in front of it
+        a_cost = len(a_text) + (len(separator(y, a_text)) if current == a_cmd else 1)
+        r_cost = len(r_text) + (len(separator(y, r_text)) if current == r_cmd else 1)
+
+        if r_cost < a_cost:
+            text, newCommand, last = r_text, r_cmd, ry
+        else:
+            text, newCommand, last = a_text, a_cmd, ay
+
+        parts.append(separator(y, text) if newCommand == current else newCommand)
+        parts.append(text)
+        y = last
+        command = newCommand
+
+    if closed:
+        parts.append("Z")
+    return "".join(parts)
+
+def writeSVGDocument(stream, width : float, height : float, paths, strokeWidth : float = 0.25):
+    # paths: list of 'd' attribute strings, all drawn with the same stroke
+    stream.write(SVG_HEADER.format(width=width, height=height))
+    for d in paths:
+        stream.write(SVG_PATH.format(d=d, stroke=strokeWidth))
+    stream.write(SVG_FOOTER)
@@ -0,0 +1,189 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Headless PNG previews of sprocket designs, e.g. for a parts catalog.
+#
+#   tapesprocketdesigner thumbs designs.csv -o thumbs --size 256
+#
+# Every sprocket is drawn into a QImage: the outline filled, the inner, design
+# and outer diameters as dashed circles, and a legend with their values below.
+# No window is involved; Qt runs on the offscreen platform unless a
+# QGuiApplication exists already. The geometry of all designs is computed in
+# one vectorized pass, and the images are drawn and written on a thread pool
+# (painting on a QImage is allowed outside the GUI thread). PySide6 looks up
+# Qt enums lazily, which is not thread safe, so the ones used here are looked
+# up once at import.
+#
+# The outline is transformed to pixels with NumPy and tessellated to a fraction
+# of a pixel, so the painter only sees as many points as are visible.
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from PySide6.QtGui import QGuiApplication, QImage, QPainter, QPolygonF, QColor, QPen, QBrush, QFont, QFontMetrics
+from PySide6.QtCore import Qt, QPointF, QRectF
+
+from .geometry import computeSprockets
+from .profiling import span
+
+# arcs are tessellated to this many pixels
+PIXEL_TOLERANCE = 0.25
+
+# empty space around the sprocket, as a fraction of the drawing area
+MARGIN_FRACTION = 0.05
+
+# PNG quality as passed to QImage.save: 80 compresses with less effort and
+# writes faster; the default gives slightly smaller files
+PNG_QUALITY = 80
+
+# circle and legend colour of every annotated diameter
+ANNOTATIONS = (
+    ("inner", "inner_radius", "blue"),
+    ("design", "design_radius", "green"),
+    ("outer", "outer_radius", "red"),
+)
+
+IMAGE_FORMAT = QImage.Format.Format_RGB32
+ANTIALIASING = QPainter.RenderHint.Antialiasing
+DASH_LINE = Qt.PenStyle.DashLine
+NO_BRUSH = Qt.BrushStyle.NoBrush
+LEGEND_ALIGNMENT = Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
+
+class ThumbnailOptions(NamedTuple):
+    size : int = 256                    # width and height in pixels
+    scale : float = None                # pixels per unit of length, None fits every sprocket
+    annotate : bool = True              # diameter circles and legend
+
+application = None
+
+def ensureApplication():
+    # QImage painting needs a QGuiApplication, for fonts in particular
+    global application
+    if QGuiApplication.instance() is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        application = QGuiApplication([])
+
+def legendLines(sprocket, title : str = None) -> list:
+    # (text, colour) of every legend line
+    lines = [(title, "black")] if title else []
+    for label, attribute, colour in ANNOTATIONS:
+        lines.append(("{:s} Ø {:.3f} mm".format(label, 2*getattr(sprocket, attribute)), colour))
+    return lines
+
+def renderThumbnail(sprocket, options : ThumbnailOptions = ThumbnailOptions(), title : str = None):
+    # returns a QImage of options.size x options.size pixels
+    size = options.size
+    image = QImage(size, size, IMAGE_FORMAT)
+    image.fill(QColor("white"))
+    painter = QPainter(image)
+    try:
+        drawThumbnail(painter, sprocket, options, title)
+    finally:
+        painter.end()
+    return image
+
+def drawThumbnail(painter : QPainter, sprocket, options : ThumbnailOptions, title : str):
+    size = options.size
+    painter.setRenderHint(ANTIALIASING)
+
+    # the legend takes a band at the bottom, the sprocket is centered above it
+    lines = legendLines(sprocket, title) if options.annotate else []
+    font = QFont()
+    font.setPixelSize(max(8, size // 24))
+    painter.setFont(font)
+    lineHeight = QFontMetrics(font).height()
+    band = lineHeight * len(lines) + (lineHeight // 2 if lines else 0)
+    area = max(size - band, 1)
+    cx, cy = size / 2, area / 2
+
+    scale = options.scale
+    if scale is None:
+        scale = min(size, area) * (1 - 2*MARGIN_FRACTION) / (2*sprocket.max_outer_radius)
+
+    pixels = sprocket.outline.tessellate(PIXEL_TOLERANCE / scale).vertices * (scale, -scale) + (cx, cy)
+    painter.setPen(QPen(QColor("black"), 1))
+    painter.setBrush(QBrush(QColor("lightgrey")))
+    painter.drawPolygon(QPolygonF([QPointF(x, y) for x, y in pixels.tolist()]))
+
+    if options.annotate:
+        painter.setBrush(NO_BRUSH)
+        for _, attribute, colour in ANNOTATIONS:
+            radius = scale * getattr(sprocket, attribute)
+            painter.setPen(QPen(QColor(colour), 1, DASH_LINE))
+            painter.drawEllipse(QPointF(cx, cy), radius, radius)
+
+        y = area + lineHeight // 2
+        for text, colour in lines:
+            painter.setPen(QColor(colour))
+            painter.drawText(QRectF(lineHeight // 2, y, size - lineHeight, lineHeight),
+                LEGEND_ALIGNMENT, text)
+            y += lineHeight
+
+def writeThumbnail(fileName : str, sprocket, options : ThumbnailOptions = ThumbnailOptions(), title : str = None):
+    with span("export.png"):
+        image = renderThumbnail(sprocket, options, title)
+        with span("write.png"):
+            if not image.save(fileName, "PNG", PNG_QUALITY):
+                raise OSError("cannot write " + fileName)
+
+def renderThumbnails(rows, outputDir : str, options : ThumbnailOptions = ThumbnailOptions(), jobs : int = None) -> list:
+    # Writes <outputDir>/<name>.png for every (name, SprocketParameters) row.
+    # Returns (name, file name or None, error message or None) per row.
+    ensureApplication()
+    os.makedirs(outputDir, exist_ok=True)
+    with span("geometry"):
+        sprockets = computeSprockets([params for _, params in rows])
+
+    def render(index):
+        name = rows[index][0]
+        sprocket = sprockets[index]
+        if not sprocket.isValid():
+            return (name, None, "the parameters do not describe a valid sprocket")
+        fileName = os.path.join(outputDir, name + ".png")
+        try:
+            writeThumbnail(fileName, sprocket, options, name)
+        except (OSError, ValueError) as e:
+            # ValueError: a --scale so large that the outline would get too many points
+            return (name, None, str(e))
+        return (name, fileName, None)
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        return list(pool.map(render, range(len(rows))))
+
+def main(argv=None):
+    from .batch import readRows
+
+    parser = argparse.ArgumentParser(prog="tapesprocketdesigner thumbs",
+        description="Render PNG previews of the designs in a CSV or JSONL parameter file.")
+    parser.add_argument("input", help="CSV or JSONL file with one design per row (see 'batch')")
+    parser.add_argument("-o", "--output", default="thumbs", help="output directory (default: %(default)s)")
+    parser.add_argument("--size", type=int, default=ThumbnailOptions().size,
+        help="width and height in pixels (default: %(default)s)")
+    parser.add_argument("--scale", type=float, default=None,
+        help="pixels per mm, the same for all designs (default: fit every design into the image)")
+    parser.add_argument("--no-annotations", action="store_true", help="leave out the diameter circles and legend")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+        help="number of worker threads (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    if args.size < 16 or (args.scale is not None and args.scale <= 0):
+        parser.error("--size must be at least 16 and --scale positive")
+    try:
+        with span("parse"):
+            rows = readRows(args.input)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    t0 = time.perf_counter()
+    results = renderThumbnails(rows, args.output, ThumbnailOptions(args.size, args.scale, not args.no_annotations),
+        args.jobs)
+    elapsed = time.perf_counter() - t0
+
+    failed = [(name, error) for name, fileName, error in results if error]
+    for name, error in failed:
+        print("{:s}: {:s}".format(name, error))
+    print("{:d} thumbnails written to {:s} in {:.2f} s".format(len(results) - len(failed), args.output, elapsed))
+    return 1 if failed else 0
@@ -0,0 +1,264 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Cutter compensation for milling the sprocket outline.
+#
+# offsetOutline computes the path of the cutter center: every line and arc of
+# the outline is moved out by the cutter radius, convex corners are joined by
+# arcs around the original corner and concave corners are trimmed to the
+# intersection of the two neighbouring offset edges. All edges are handled in
+# one vectorized pass.
+#
+# A round cutter cannot reach into the concave corners where the tooth flanks
+# meet the inner radius and leaves a small shoulder there; shoulderDrills
+# returns one drill hit per corner that takes it off.
+#
+# An offset that does not fit, because the cutter is wider than the space
+# between the teeth or the path crosses itself, raises ValueError, so no
+# G-code is ever generated from it.
+
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from .geometry import polarToRect
+from .outline import Outline, bulgeArcs
+
+# turns smaller than this (radians) count as tangent continuous
+TANGENT_TOLERANCE = 1e-9
+
+# edges shorter than this are dropped before offsetting
+EDGE_TOLERANCE = 1e-12
+
+# arcs of an offset path are tessellated to this fraction of the offset
+# distance for the self-intersection check
+INTERSECTION_TOLERANCE = 0.01
+
+# average number of pieces an edge is cut into for the self-intersection check
+PIECES_PER_EDGE = 16
+
+class MillingOptions(NamedTuple):
+    # all lengths in the units of the design
+    tool_dia : float = 1.0
+    depth : float = 3.0                 # total cutting depth, usually the stock thickness
+    step_down : float = 1.0             # depth per profile pass
+    safe_z : float = 5.0                # clearance height for rapid moves
+    feed : float = 300.0                # cutting feed per minute
+    plunge_feed : float = 100.0         # plunge feed per minute
+    drills : bool = True                # remove the shoulders at the base of the flanks
+
+def perpendicular(v : np.ndarray) -> np.ndarray:
+    # vectors rotated 90 degrees counterclockwise
+    return np.stack((-v[..., 1], v[..., 0]), axis=-1)
+
+def cross(a : np.ndarray, b : np.ndarray) -> np.ndarray:
+    return a[..., 0]*b[..., 1] - a[..., 1]*b[..., 0]
+
+def intersectLines(p0, d0, p1, d1):
+    # intersection of the lines p0 + s*d0 and p1 + t*d1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = cross(p0 - p1, d0) / cross(d1, d0)
+    return p1 + t[:, np.newaxis] * d1
+
+def intersectLineCircle(p, d, center, radius, near):
+    # intersection of the line p + t*d (d of unit length) with a circle, the one closest to 'near'
+    f = p - center
+    half_b = (f*d).sum(axis=-1)
+    c = (f*f).sum(axis=-1) - radius*radius
+    with np.errstate(invalid='ignore'):
+        root = np.sqrt(half_b*half_b - c)
+    x0 = p + (-half_b - root)[:, np.newaxis] * d
+    x1 = p + (-half_b + root)[:, np.newaxis] * d
+    return closest(x0, x1, near)
+
+def intersectCircles(c0, r0, c1, r1, near):
+    # intersection of two circles, the one closest to 'near'
+    delta = c1 - c0
+    dist = np.hypot(delta[:, 0], delta[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = (r0*r0 - r1*r1 + dist*dist) / (2*dist)
+        h = np.sqrt(r0*r0 - a*a)
+        unit = delta / dist[:, np.newaxis]
+    mid = c0 + a[:, np.newaxis] * unit
+    x0 = mid + h[:, np.newaxis] * perpendicular(unit)
+    x1 = mid - h[:, np.newaxis] * perpendicular(unit)
+    return closest(x0, x1, near)
+
+def closest(x0, x1, near):
+    d0 = ((x0 - near)**2).sum(axis=-1)
+    d1 = ((x1 - near)**2).sum(axis=-1)
+    return np.where((d0 <= d1)[:, np.newaxis], x0, x1)
+
+def selfIntersects(vertices : np.ndarray) -> bool:
+    # True when two edges of a closed ring of straight edges cross each other.
+    # The edges are cut into pieces no longer than a grid cell, the pieces are
+    # binned into the cells their bounding box covers (at most 2 x 2), and only
+    # edges that share a cell are compared. Edges that merely touch do not count.
+    n = len(vertices)
+    if n < 4:
+        return False
+    a = vertices
+    b = np.roll(vertices, -1, axis=0)
+    length = np.hypot(*(b - a).T)
+    cell = max(length.sum() / (PIECES_PER_EDGE * n), np.median(length), EDGE_TOLERANCE)
+
+    pieces = np.maximum(np.ceil(length / cell).astype(np.int64), 1)
+    edge = np.repeat(np.arange(n), pieces)
+    t = np.arange(len(edge)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    p0 = a[edge] + (b - a)[edge] * (t / pieces[edge])[:, np.newaxis]
+    p1 = a[edge] + (b - a)[edge] * ((t + 1) / pieces[edge])[:, np.newaxis]
+    origin = vertices.min(axis=0)
+    first = np.floor((np.minimum(p0, p1) - origin) / cell).astype(np.int64)
+    last = np.floor((np.maximum(p0, p1) - origin) / cell).astype(np.int64)
+
+    # one (cell, edge) entry for every cell a piece covers
+    rows = last[:, 1].max() + 2
+    key = np.concatenate([(first[:, 0] + dx) * rows + first[:, 1] + dy
+        for dx in (0, 1) for dy in (0, 1)])
+    covered = np.concatenate([(first[:, 0] + dx <= last[:, 0]) & (first[:, 1] + dy <= last[:, 1])
+        for dx in (0, 1) for dy in (0, 1)])
+    key = key[covered]
+    edge = np.tile(edge, 4)[covered]
+    order = np.lexsort((edge, key))
+    key = key[order]
+    edge = edge[order]
+    unique = np.ones(len(key), dtype=bool)
+    unique[1:] = (key[1:] != key[:-1]) | (edge[1:] != edge[:-1])
+    key = key[unique]
+    edge = edge[unique]
+
+    # pairs of entries in the same cell, d entries apart in the sorted order; the
+    # entries with a partner d+1 apart are a subset of those with one d apart
+    same = np.arange(len(key) - 1)
+    d = 1
+    while len(same) > 0:
+        same = same[same + d < len(key)]
+        same = same[key[same] == key[same + d]]
+        i = edge[same]
+        j = edge[same + d]
+        # neighbouring edges share a vertex
+        apart = j - i
+        i = i[(apart > 1) & (apart < n - 1)]
+        j = j[(apart > 1) & (apart < n - 1)]
+        o1 = cross(b[i] - a[i], a[j] - a[i])
+        o2 = cross(b[i] - a[i], b[j] - a[i])
+        o3 = cross(b[j] - a[j], a[i] - a[j])
+        o4 = cross(b[j] - a[j], b[i] - a[j])
+        if ((o1*o2 < 0) & (o3*o4 < 0)).any():
+            return True
+        d += 1
+    return False
+
+def offsetOutline(outline : Outline, distance : float) -> Outline:
+    # Offset a closed outline by 'distance': outward when positive, inward when negative.
+    # Raises ValueError when the offset does not fit, e.g. a cutter wider than the space between the teeth,
+    # or when the resulting path would cross itself.
+    if distance == 0:
+        return outline
+
+    # zero length edges, e.g. the tip of a pointed tooth, have no direction
+    v0 = outline.vertices
+    bulges = np.zeros(len(v0)) if outline.bulges is None else outline.bulges
+    chord = np.roll(v0, -1, axis=0) - v0
+    keep = np.hypot(chord[:, 0], chord[:, 1]) > EDGE_TOLERANCE
+    v0 = v0[keep]
+    bulges = bulges[keep]
+    v1 = np.roll(v0, -1, axis=0)
+
+    # make 'outward' the right hand side of every edge
+    area = cross(v0, v1).sum() / 2
+    if area < 0:
+        distance = -distance
+
+    is_arc = bulges != 0
+    arc = is_arc[:, np.newaxis]
+    center, radius, _, sweep = bulgeArcs(v0, bulges)
+    side = np.where(sweep < 0, -1.0, 1.0)
+
+    chord = v1 - v0
+    direction = chord / np.hypot(chord[:, 0], chord[:, 1])[:, np.newaxis]
+    safe_radius = np.where(is_arc, radius, 1.0)[:, np.newaxis]
+
+    # unit tangent and right hand normal at the start and end of every edge
+    normal0 = np.where(arc, side[:, np.newaxis] * (v0 - center) / safe_radius, -perpendicular(direction))
+    normal1 = np.where(arc, side[:, np.newaxis] * (v1 - center) / safe_radius, -perpendicular(direction))
+    tangent0 = perpendicular(normal0)
+    tangent1 = perpendicular(normal1)
+
+    new_radius = radius + side*distance
+    if (is_arc & (new_radius <= 0)).any():
+        raise ValueError("offsetOutline: offset is larger than the radius of a concave arc")
+
+    start = v0 + distance*normal0
+    end = v1 + distance*normal1
+
+    # turn angle at every vertex, from the end of the previous edge to the start of this one
+    prev_tangent = np.roll(tangent1, 1, axis=0)
+    turn = np.arctan2(cross(prev_tangent, tangent0), (prev_tangent*tangent0).sum(axis=-1))
+    convex = np.sign(distance)*turn > TANGENT_TOLERANCE
+    concave = np.sign(distance)*turn < -TANGENT_TOLERANCE
+
+    # concave corners: trim the previous and this edge to their intersection
+    idx = np.flatnonzero(concave)
+    prev = (idx - 1) % len(v0)
+    near = v0[idx]
+    joint = np.empty((len(idx), 2))
+    for prev_arc, this_arc in ((False, False), (True, False), (False, True), (True, True)):
+        sel = (is_arc[prev] == prev_arc) & (is_arc[idx] == this_arc)
+        p, i = prev[sel], idx[sel]
+        if not prev_arc and not this_arc:
+            joint[sel] = intersectLines(start[p], direction[p], start[i], direction[i])
+        elif prev_arc and not this_arc:
+            joint[sel] = intersectLineCircle(start[i], direction[i], center[p], new_radius[p], near[sel])
+        elif not prev_arc:
+            joint[sel] = intersectLineCircle(start[p], direction[p], center[i], new_radius[i], near[sel])
+        else:
+            joint[sel] = intersectCircles(center[p], new_radius[p], center[i], new_radius[i], near[sel])
+    start[idx] = joint
+    end[prev] = joint
+
+    # trimming must not turn an edge around
+    with np.errstate(invalid='ignore'):
+        a0 = np.arctan2(start[:, 1] - center[:, 1], start[:, 0] - center[:, 0])
+        a1 = np.arctan2(end[:, 1] - center[:, 1], end[:, 0] - center[:, 0])
+        new_sweep = np.where(sweep < 0, -np.mod(a0 - a1, 2*math.pi), np.mod(a1 - a0, 2*math.pi))
+        forward = ((end - start)*direction).sum(axis=-1)
+        valid = np.isfinite(start).all(axis=-1) & np.where(is_arc,
+            np.abs(new_sweep) <= np.abs(sweep) + TANGENT_TOLERANCE, forward >= -TANGENT_TOLERANCE)
+    if not valid.all():
+        raise ValueError("offsetOutline: offset does not fit into the outline")
+
+    # every edge contributes its start point, followed by the start of the
+    # join arc around the next vertex when that vertex is convex
+    vertices = np.stack((start, end), axis=1).reshape(-1, 2)
+    edge_bulges = np.stack((np.where(is_arc, np.tan(new_sweep / 4), 0.0),
+        np.roll(np.tan(turn / 4), -1)), axis=1).reshape(-1)
+    join = np.stack((np.ones(len(v0), dtype=bool), np.roll(convex, -1)), axis=1).reshape(-1)
+
+    path = Outline(vertices[join], edge_bulges[join])
+    if distance != 0 and selfIntersects(path.tessellate(abs(distance) * INTERSECTION_TOLERANCE).vertices):
+        raise ValueError("offsetOutline: the offset path intersects itself")
+    return path
+
+def shoulderDrills(sprocket, tool_dia : float) -> np.ndarray:
+    # (2*n_teeth, 2) drill hits on the inner radius, one cutter radius away from
+    # the flank after and before every tooth, so the drill just touches the flank
+    if tool_dia <= 0:
+        return np.zeros((0, 2))
+
+    n_teeth = int(sprocket.params.n_teeth)
+    offset = sprocket.chord_angle/2 + math.degrees(math.asin(min(tool_dia / (2*sprocket.inner_radius), 1.0)))
+    tooth_centers = (360.0 / n_teeth) * np.arange(n_teeth, dtype=np.float64)[:, np.newaxis]
+    theta = tooth_centers + (offset, (360.0 / n_teeth) - offset)
+    return polarToRect(sprocket.inner_radius, theta).reshape(-1, 2)
+
+def computeToolpath(sprocket, options : MillingOptions) -> Outline:
+    # cutter center path around the outside of the sprocket, with the shoulder drill hits as its points.
+    # Raises ValueError for an invalid sprocket or a cutter that does not fit.
+    if not sprocket.isValid():
+        raise ValueError("computeToolpath: the parameters do not describe a valid sprocket")
+    path = offsetOutline(sprocket.outline, options.tool_dia / 2)
+    if options.drills:
+        return Outline(path.vertices, path.bulges, shoulderDrills(sprocket, options.tool_dia))
+    return path
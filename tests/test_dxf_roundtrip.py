@@ -0,0 +1,122 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# The streaming DXF writer (LINE/ARC and LWPOLYLINE modes) against the ezdxf
+# reference writer: every file has to pass ezdxf's audit without errors or
+# fixes, and all of them have to describe the same geometry.
+
+import numpy as np
+import pytest
+
+ezdxf = pytest.importorskip("ezdxf")
+
+from tapesprocketdesigner.geometry import SprocketParameters, computeSprocket
+from tapesprocketdesigner.outline import Outline
+from tapesprocketdesigner.exporters import writeDXF, writeDXFEzdxf
+from tapesprocketdesigner.toolpath import shoulderDrills
+
+# coordinates are written with more decimals than this
+ABS_TOLERANCE = 1e-6
+
+# entities are sorted on their coordinates rounded to this many decimals, so
+# that rounding noise does not change the order
+SORT_DECIMALS = 6
+
+def sprocketOutline(n_teeth : int = 14, drills : bool = False, tolerance : float = None) -> Outline:
+    sprocket = computeSprocket(SprocketParameters(n_teeth=n_teeth))
+    outline = sprocket.outline
+    if drills:
+        outline = Outline(outline.vertices, outline.bulges, shoulderDrills(sprocket, 1.0))
+    return outline.tessellate(tolerance) if tolerance else outline
+
+OUTLINES = {
+    "arcs" : lambda: sprocketOutline(),
+    "drills" : lambda: sprocketOutline(100, drills=True),
+    "tessellated" : lambda: sprocketOutline(tolerance=0.01),
+}
+
+def readBack(fileName):
+    doc = ezdxf.readfile(str(fileName))
+    auditor = doc.audit()
+    assert len(auditor.errors) == 0, [str(e) for e in auditor.errors]
+    assert len(auditor.fixes) == 0, [str(e) for e in auditor.fixes]
+    return doc
+
+def sortedRows(rows, width : int) -> np.ndarray:
+    rows = np.array(rows, dtype=np.float64).reshape(-1, width)
+    rounded = np.round(rows, SORT_DECIMALS)
+    return rows[np.lexsort(rounded.T[::-1])]
+
+def lineKeys(entities) -> np.ndarray:
+    # LINE entities as sorted rows of (x0, y0, x1, y1), each with its end points in order
+    rows = []
+    for e in entities:
+        p0, p1 = tuple(e.dxf.start)[:2], tuple(e.dxf.end)[:2]
+        if np.round(p1, SORT_DECIMALS).tolist() < np.round(p0, SORT_DECIMALS).tolist():
+            p0, p1 = p1, p0
+        rows.append(p0 + p1)
+    return sortedRows(rows, 4)
+
+def arcKeys(entities) -> np.ndarray:
+    # ARC entities as sorted rows of (cx, cy, r, start x, start y, end x, end y); the
+    # end points instead of the angles, so 0 and 360 degrees compare equal
+    rows = []
+    for e in entities:
+        start, end = e.start_point, e.end_point
+        rows.append((e.dxf.center.x, e.dxf.center.y, e.dxf.radius, start.x, start.y, end.x, end.y))
+    return sortedRows(rows, 7)
+
+def pointKeys(entities) -> np.ndarray:
+    return sortedRows([tuple(e.dxf.location)[:2] for e in entities], 2)
+
+def geometry(entities) -> dict:
+    entities = list(entities)
+    return {
+        "LINE" : lineKeys(e for e in entities if e.dxftype() == "LINE"),
+        "ARC" : arcKeys(e for e in entities if e.dxftype() == "ARC"),
+        "POINT" : pointKeys(e for e in entities if e.dxftype() == "POINT"),
+    }
+
+def assertSameGeometry(actual : dict, expected : dict):
+    for kind in expected:
+        assert actual[kind].shape == expected[kind].shape, kind
+        np.testing.assert_allclose(actual[kind], expected[kind], atol=ABS_TOLERANCE, err_msg=kind)
+
+@pytest.fixture(params=sorted(OUTLINES))
+def outline(request):
+    return OUTLINES[request.param]()
+
+@pytest.fixture
+def reference(outline, tmp_path) -> dict:
+    fileName = tmp_path / "ezdxf.dxf"
+    writeDXFEzdxf(str(fileName), outline)
+    return geometry(readBack(fileName).modelspace())
+
+def test_lines_match_ezdxf(outline, reference, tmp_path):
+    fileName = tmp_path / "lines.dxf"
+    writeDXF(str(fileName), outline)
+    msp = readBack(fileName).modelspace()
+
+    assert set(e.dxftype() for e in msp) <= {"LINE", "ARC", "POINT"}
+    assertSameGeometry(geometry(msp), reference)
+    assert len(reference["LINE"]) + len(reference["ARC"]) == len(outline)
+
+def test_polyline_matches_ezdxf(outline, reference, tmp_path):
+    fileName = tmp_path / "polyline.dxf"
+    writeDXF(str(fileName), outline, polyline=True)
+    msp = readBack(fileName).modelspace()
+
+    polylines = msp.query("LWPOLYLINE")
+    assert len(polylines) == 1
+    polyline = polylines[0]
+    assert polyline.closed
+
+    # x, y and bulge of every vertex as written
+    data = np.array(polyline.get_points("xyb"))
+    bulges = np.zeros(len(outline)) if outline.bulges is None else outline.bulges
+    np.testing.assert_allclose(data[:, :2], outline.vertices, atol=ABS_TOLERANCE)
+    np.testing.assert_allclose(data[:, 2], bulges, atol=ABS_TOLERANCE)
+
+    # exploded into lines and arcs it is the same drawing as the ezdxf file
+    exploded = geometry(list(polyline.virtual_entities()) + list(msp.query("POINT")))
+    assertSameGeometry(exploded, reference)
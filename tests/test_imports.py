@@ -0,0 +1,32 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# The headless modules must not pull in Qt or the optional export packages,
+# and must import in reasonable time. Every import is measured in a fresh
+# interpreter by benchmarks/importtime.py.
+
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("importtime", os.path.join(ROOT, "benchmarks", "importtime.py"))
+importtime = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(importtime)
+
+# generous compared to the script's 400 ms default, slow CI machines included
+BUDGET_MS = 2000.0
+
+RUNS = 3
+
+@pytest.mark.parametrize("module", importtime.HEADLESS_MODULES)
+def test_headless_import(module):
+    best = None
+    for _ in range(RUNS):
+        total, packages = importtime.measureImport(module)
+        best = total if best is None else min(best, total)
+
+    assert sorted(p for p in packages if p in importtime.HEAVY_PACKAGES) == []
+    assert best / 1000.0 <= BUDGET_MS
@@ -0,0 +1,116 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# svgwriter.pathData read back with a tokenizer that follows the SVG path
+# grammar: numbers may run into each other ("1-2", ".5.5"), arc flags are
+# single digits. On top of the grammar, every flag has to be followed by a
+# separator, because many readers take "1.589" for a single number.
+
+import re
+
+import numpy as np
+import pytest
+
+from tapesprocketdesigner.geometry import SprocketParameters, computeSprocket
+from tapesprocketdesigner.svgwriter import pathData
+
+NUMBER = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+SEPARATORS = " \t\r\n,"
+
+# parameters per command, 'f' for a flag
+ARGUMENTS = { "M" : "nn", "L" : "nn", "A" : "nnnffnn", "Z" : "" }
+
+class Reader:
+
+    def __init__(self, text : str):
+        self.text = text
+        self.pos = 0
+
+    def skip(self):
+        while self.pos < len(self.text) and self.text[self.pos] in SEPARATORS:
+            self.pos += 1
+
+    def atNumber(self) -> bool:
+        self.skip()
+        return self.pos < len(self.text) and NUMBER.match(self.text, self.pos) is not None
+
+    def number(self) -> float:
+        self.skip()
+        match = NUMBER.match(self.text, self.pos)
+        assert match is not None, self.text[self.pos:self.pos+20]
+        self.pos = match.end()
+        return float(match.group())
+
+    def flag(self) -> int:
+        self.skip()
+        assert self.text[self.pos] in "01", self.text[self.pos:self.pos+20]
+        self.pos += 1
+        assert self.pos < len(self.text) and self.text[self.pos] in SEPARATORS, \
+            "flag glued to the next number: " + self.text[self.pos-12:self.pos+12]
+        return int(self.text[self.pos - 1])
+
+def endPoints(d : str) -> tuple:
+    # returns the end point of every drawing command and whether the path was closed
+    reader = Reader(d)
+    points = []
+    current = np.zeros(2)
+    command = None
+    closed = False
+    while True:
+        reader.skip()
+        if reader.pos == len(d):
+            break
+        assert not closed, "data after Z"
+        if d[reader.pos].isalpha():
+            command = d[reader.pos]
+            reader.pos += 1
+        else:
+            # implicit repetition; coordinates after M are linetos
+            assert command is not None and command.upper() != "Z" and reader.atNumber()
+            command = {"M" : "L", "m" : "l"}.get(command, command)
+
+        arguments = [reader.number() if kind == "n" else reader.flag() for kind in ARGUMENTS[command.upper()]]
+        if command.upper() == "Z":
+            closed = True
+            continue
+        target = np.array(arguments[-2:])
+        current = target if command.isupper() else current + target
+        points.append(current)
+        if command.upper() == "A":
+            assert arguments[0] > 0 and arguments[1] > 0
+
+    return np.array(points), closed
+
+def randomArcs(count : int = 24, seed : int = 3) -> tuple:
+    # vertices around a circle with fractional coordinates and arcs of both directions,
+    # including radii below 1 (written as ".xyz")
+    rng = np.random.default_rng(seed)
+    angle = np.sort(rng.uniform(0, 2*np.pi, count))
+    radius = rng.uniform(0.2, 12.0, count)
+    vertices = np.stack((radius*np.cos(angle), radius*np.sin(angle)), axis=-1) + (0.37, -0.61)
+    bulges = np.where(rng.random(count) < 0.7, rng.uniform(-1.5, 1.5, count), 0.0)
+    return vertices, bulges
+
+def sprocketArcs() -> tuple:
+    outline = computeSprocket(SprocketParameters()).outline
+    return outline.vertices + (10.0, 10.0), outline.bulges
+
+SHAPES = { "random" : randomArcs, "sprocket" : sprocketArcs }
+
+@pytest.mark.parametrize("precision", range(7))
+@pytest.mark.parametrize("shape", sorted(SHAPES))
+def test_path_round_trip(shape, precision):
+    vertices, bulges = SHAPES[shape]()
+    d = pathData(vertices, precision, bulges=bulges)
+    assert d.endswith("Z")
+
+    points, closed = endPoints(d)
+    assert closed
+
+    # the start point, the end point of every edge, and the start point again for
+    # an arc on the closing edge
+    expected = np.round(vertices, precision)
+    expected = np.concatenate((expected, expected[:1])) if bulges[-1] != 0 else expected
+    assert points.shape == expected.shape
+    np.testing.assert_allclose(points, expected, atol=1e-9)
+    assert "A" in d or "a" in d
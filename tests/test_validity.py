@@ -0,0 +1,60 @@
+# Copyright 2023 - 2023, Niels Moseley and the pyrigremote contributors
+# SPDX-License-Identifier: GPL-3.0-only
+
+# Sprocket.isValid, the vectorized validDesigns behind it and the solver,
+# which has to offer valid designs only.
+
+import numpy as np
+import pytest
+
+from tapesprocketdesigner.geometry import SprocketParameters, computeRadii, computeSprocket, \
+    computeSprockets, validDesigns
+from tapesprocketdesigner.solver import solveDesigns
+
+INVALID = [
+    SprocketParameters(0, 1, 4, 1, 60),         # no teeth
+    SprocketParameters(-5, 1, 4, 1, 60),
+    SprocketParameters(14, 5, 4, 1, 60),        # teeth overlap
+    SprocketParameters(14, 1, 4, 100, 60),      # flanks past the center
+    SprocketParameters(14, 1, 4, 1, 150),       # tooth faces cross
+    SprocketParameters(14, 1, 4, 1, -5),        # outer radius below the design radius
+    SprocketParameters(14, 1, 4, -2, 60),       # inner radius outside the design radius
+    SprocketParameters(14, -1, 4, 1, 60),
+    SprocketParameters(14, 1, -4, 1, 60),
+]
+
+VALID = [
+    SprocketParameters(),
+    SprocketParameters(3, 1, 4, 1, 60),
+    SprocketParameters(14, 1, 4, 1, 0),
+    SprocketParameters(14, 1, 4, 1, 100),
+    SprocketParameters(1000, 1.5, 4, 1, 60),
+]
+
+@pytest.mark.parametrize("params", INVALID)
+def test_invalid(params):
+    assert not computeSprocket(params).isValid()
+
+@pytest.mark.parametrize("params", VALID)
+def test_valid(params):
+    assert computeSprocket(params).isValid()
+
+def test_vectorized_matches_isValid():
+    rng = np.random.default_rng(7)
+    table = np.stack((rng.integers(-2, 60, 500), rng.uniform(-1, 6, 500), rng.uniform(-1, 6, 500),
+        rng.uniform(-2, 20, 500), rng.uniform(-20, 120, 500)), axis=-1)
+    rows = [SprocketParameters(int(r[0]), *r[1:].tolist()) for r in table]
+
+    valid = validDesigns(table.T, computeRadii(*table.T))
+    assert valid.tolist() == [s.isValid() for s in computeSprockets(rows)]
+    assert 0 < valid.sum() < len(rows)
+
+@pytest.mark.parametrize("tooth_dia, tooth_pitch, flank_height, lo, hi", [
+    (4.5, 4, 1, 20, 40),
+    (3.9, 4, 1, 20, 40),
+    (1, 4, 1, 20, 40),
+    (1, 4, 3, 5, 15),
+])
+def test_solver_results_are_valid(tooth_dia, tooth_pitch, flank_height, lo, hi):
+    for result in solveDesigns(tooth_dia, tooth_pitch, flank_height, lo, hi):
+        assert computeSprocket(result.params).isValid(), result.params